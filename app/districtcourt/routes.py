@@ -38,6 +38,17 @@ def _catalog_has(kind: str, level: str, extra: dict | None = None) -> bool:
     return "catalog" in db.list_collection_names() and db.catalog.count_documents(filt, limit=1) > 0
 
 
+def _dc_content(doc: dict) -> str:
+    """Full HTML of a district-court doc: inline `content` (older ingests) or its `district_court_blob` row."""
+    if doc.get("content") is not None:
+        return doc["content"]
+    blob_id = doc.get("content_blob")
+    if not blob_id:
+        return ""
+    blob = db.district_court_blob.find_one({"_id": blob_id}, {"content": 1})
+    return (blob or {}).get("content", "")
+
+
 def _prepare_dc_html_and_roles(full_html: str):
     """Trim page chrome, keep annotated body, and collect [data-structure] roles."""
     soup = BeautifulSoup(full_html or "", "html.parser")
@@ -236,7 +247,7 @@ def view(doc_id: int):
         doc["doc_id"] = int(doc.get("doc_id") or doc_id)
         doc["title"] = doc.get("full_title") or doc.get("title") or f"Doc {doc_id}"
 
-        cleaned_html, role_order, role_colors = _prepare_dc_html_and_roles(doc.get("content", ""))
+        cleaned_html, role_order, role_colors = _prepare_dc_html_and_roles(_dc_content(doc))
         doc["content"] = cleaned_html
 
         return render_template(
@@ -255,11 +266,11 @@ def view(doc_id: int):
 def api_ner_html(doc_id: int):
     """Return NER-annotated HTML for a district-court doc: { html: "<annotated>" }"""
     try:
-        doc = db.district_court.find_one({"doc_id": doc_id}, {"_id": 0, "content": 1})
+        doc = db.district_court.find_one({"doc_id": doc_id}, {"_id": 0, "content": 1, "content_blob": 1})
         if not doc:
             abort(404)
 
-        cleaned_html, _, _ = _prepare_dc_html_and_roles(doc.get("content", ""))
+        cleaned_html, _, _ = _prepare_dc_html_and_roles(_dc_content(doc))
         annotated = _get_ner_engine().annotate_html(cleaned_html) if cleaned_html else ""
         print(annotated)
         return jsonify({"html": annotated})
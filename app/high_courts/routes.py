@@ -143,19 +143,24 @@ def _run_opennyai(kind: str, text: str) -> dict:
 
 
 # ------------------------------ text utilities -------------------------------
+_JUNK_BLOCK_RE = re.compile(r"(?is)<(script|style|noscript|template)[^>]*>.*?</\1>")
+_TAG_RE        = re.compile(r"(?s)<[^>]+>")
+_WS_RE         = re.compile(r"\s+")
+_SENTENCE_RE   = re.compile(r"(?<=[.?!])\s+")
+
 def _strip_tags_and_junk(html: str) -> str:
     """Remove script/style/noscript/template blocks first, then strip tags."""
     if not html:
         return ""
-    html = re.sub(r"(?is)<(script|style|noscript|template)[^>]*>.*?</\1>", " ", html)
-    html = re.sub(r"(?s)<[^>]+>", " ", html)
-    html = re.sub(r"\s+", " ", html).strip()
+    html = _JUNK_BLOCK_RE.sub(" ", html)
+    html = _TAG_RE.sub(" ", html)
+    html = _WS_RE.sub(" ", html).strip()
     return html
 
 def _sentences(text: str) -> list[str]:
     if not text:
         return []
-    parts = re.split(r"(?<=[.?!])\s+", text)
+    parts = _SENTENCE_RE.split(text)
     return [p.strip() for p in parts if p.strip()]
 
 def _chunk_sentences(parts: list[str], max_per_box: int = 6) -> list[str]:
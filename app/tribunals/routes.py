@@ -1,8 +1,14 @@
 # app/tribunals/routes.py
 # Routes for the Tribunals section (uses fast 'catalog' when available; falls back to main collection).
 # Templates are kept compatible by returning the same variable names your HTML expects.
+import hashlib
+import os
+import queue
+import threading
+import time
 import traceback
-from flask import Blueprint, render_template, abort, request, jsonify, url_for as _url_for  # NEW (url_for alias)
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from flask import Blueprint, current_app, render_template, abort, request, jsonify, make_response, url_for as _url_for  # NEW (url_for alias)
 from urllib.parse import unquote
 from bs4 import BeautifulSoup
 from jinja2 import TemplateNotFound
@@ -14,43 +20,183 @@ from opennyai_html_ner import OpenNyAIHtmlNER
 tribunals_bp = Blueprint("tribunals", __name__, template_folder="../templates")
 
 # -----------------------
-# NER: lazy singleton
+# NER: one engine per model, default warmed in the background at import
 # -----------------------
-_NER_ENGINE = None
-def _get_ner_engine():
-    global _NER_ENGINE
-    if _NER_ENGINE is None:
-        _NER_ENGINE = OpenNyAIHtmlNER(
-            use_gpu=False,
-            model_name="en_legal_ner_trf",
-            do_sentence_level=True,
-            do_postprocess=False,
-            prefer_spacy_direct=True,
-        )
-    return _NER_ENGINE
+# Interactive highlighting uses the small CNN pipeline by default; the
+# transformer stays available per request via ?model=trf.
+NER_MODEL = os.getenv("NER_MODEL", "en_legal_ner_sm")
+NER_MODEL_HQ = os.getenv("NER_MODEL_HQ", "en_legal_ner_trf")
+# opt-in int8 dynamic quantization of transformer weights (no-op for non-transformer
+# models); never applied to NER_MODEL_HQ, the full-quality option
+NER_QUANTIZE = os.getenv("NER_QUANTIZE", "0").lower() in ("1", "true", "yes")
+
+_NER_ENGINES: dict[str, OpenNyAIHtmlNER] = {}
+_NER_LOCK = threading.Lock()
+def _get_ner_engine(model_name: str = NER_MODEL):
+    engine = _NER_ENGINES.get(model_name)
+    if engine is None:
+        with _NER_LOCK:  # warmup thread and first request must not both load the model
+            engine = _NER_ENGINES.get(model_name)
+            if engine is None:
+                engine = OpenNyAIHtmlNER(
+                    use_gpu=False,
+                    model_name=model_name,
+                    do_sentence_level=True,
+                    do_postprocess=False,
+                    prefer_spacy_direct=True,
+                    quantize=NER_QUANTIZE and model_name != NER_MODEL_HQ,
+                )
+                engine.annotate_html("<p>warmup</p>")  # run the pipeline once
+                _NER_ENGINES[model_name] = engine
+    return engine
+
+def _warm_ner_engine():
+    try:
+        _get_ner_engine()
+    except Exception as e:
+        print(f"[TRIBUNALS][ner warmup] {e}")
+
+if os.getenv("NER_WARMUP", "1").lower() in ("1", "true", "yes"):
+    threading.Thread(target=_warm_ner_engine, name="tribunals-ner-warmup", daemon=True).start()
+
+# -----------------------
+# NER: request coalescing
+# Concurrent /api/ner calls are queued and annotated together, so the
+# model sees one batched forward pass instead of one pass per request.
+# -----------------------
+NER_BATCH_MAX = int(os.getenv("NER_BATCH_MAX", "8"))
+NER_BATCH_WAIT = float(os.getenv("NER_BATCH_WAIT_MS", "20")) / 1000.0
+# longest a request waits for its annotation (includes a cold model load) before a 503
+NER_TIMEOUT = float(os.getenv("NER_TIMEOUT_S", "120"))
+
+_NER_QUEUE: "queue.Queue[tuple[str, object, Future]]" = queue.Queue()
+_NER_WORKER = None
+_NER_WORKER_LOCK = threading.Lock()
+
+def _ner_batch_worker():
+    while True:
+        batch = [_NER_QUEUE.get()]
+        try:
+            _run_ner_batch(batch)
+        except BaseException as e:
+            # never leave a request waiting on a batch the worker gave up on
+            err = e if isinstance(e, Exception) else RuntimeError(f"NER worker stopped: {e!r}")
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(err)
+            if err is not e:
+                raise  # the next request starts a new worker
+
+def _run_ner_batch(batch: list) -> None:
+    """Top the batch up for NER_BATCH_WAIT, then annotate it with one call per model."""
+    deadline = time.monotonic() + NER_BATCH_WAIT
+    while len(batch) < NER_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_NER_QUEUE.get(timeout=remaining))
+        except queue.Empty:
+            break
+
+    # one batched call per model present in this batch; requests that timed out
+    # (cancelled) are dropped
+    by_model: dict[str, list[tuple[str, Future]]] = {}
+    for model_name, html, fut in batch:
+        if fut.set_running_or_notify_cancel():
+            by_model.setdefault(model_name, []).append((html, fut))
+    for model_name, items in by_model.items():
+        try:
+            results = _get_ner_engine(model_name).annotate_many_html([html for html, _ in items])
+        except Exception as e:
+            for _, fut in items:
+                fut.set_exception(e)
+            continue
+        for (_, fut), annotated in zip(items, results):
+            fut.set_result(annotated)
+
+def _annotate_coalesced(html, model_name: str = NER_MODEL) -> str:
+    """
+    Queue one document (HTML string or parsed Tag) for the batch worker and wait for its
+    annotated HTML. Raises concurrent.futures.TimeoutError after NER_TIMEOUT seconds.
+    """
+    global _NER_WORKER
+    if _NER_WORKER is None or not _NER_WORKER.is_alive():
+        with _NER_WORKER_LOCK:  # (re)started on demand
+            if _NER_WORKER is None or not _NER_WORKER.is_alive():
+                _NER_WORKER = threading.Thread(target=_ner_batch_worker, name="tribunals-ner-batch", daemon=True)
+                _NER_WORKER.start()
+    fut = Future()
+    _NER_QUEUE.put((model_name, html, fut))
+    try:
+        return fut.result(timeout=NER_TIMEOUT)
+    except FutureTimeout:
+        fut.cancel()  # still queued: the worker skips it
+        raise
 
 # -----------------------
 # Helpers
 # -----------------------
-def _catalog_has(kind: str, level: str, extra: dict | None = None) -> bool:
-    """Return True if the catalog has at least one row for the given filter."""
+# Page chrome removed from tribunal HTML, as one comma-separated selector
+CHROME_SEL = (
+    ".header, header, .navbar, #navbar, .footer, footer, "
+    ".sidebar, #sidebar, .adv, .ads, .ad, .share, .tools, "
+    ".translate, #google_translate_element, .logo, .search"
+)
+
+_HAS_CATALOG = None
+def _has_catalog() -> bool:
+    """Check once per process whether the 'catalog' collection exists."""
+    global _HAS_CATALOG
+    if _HAS_CATALOG is None:
+        _HAS_CATALOG = "catalog" in db.list_collection_names()
+    return _HAS_CATALOG
+
+def _catalog_rows(kind: str, level: str, extra: dict | None, projection: dict, sort_key: str) -> list:
+    """Catalog rows for the filter (sorted), or [] so the caller can fall back to the main collection."""
+    if not _has_catalog():
+        return []
     filt = {"kind": kind, "level": level}
     if extra:
         filt.update(extra)
-    return "catalog" in db.list_collection_names() and db.catalog.count_documents(filt, limit=1) > 0
+    return list(db.catalog.find(filt, projection).sort(sort_key, 1))
+
+def _doc_id_variants(did) -> list:
+    """doc_id as stored either way (int or str), for a single `$in` match."""
+    if isinstance(did, int):
+        return [did, str(did)]
+    if str(did).isdigit():
+        return [did, int(did)]
+    return [did]
 
-def _find_one_both(col, base):
-    """Try with doc_id as int & str (covers mixed storage)."""
+def _find_one_both(col, base, projection: dict | None = None):
+    """Match doc_id as int & str in one query (covers mixed storage)."""
     did = base.get("doc_id")
-    q = [{"doc_id": did}, {"doc_id": str(did)}] if isinstance(did, int) else [{"doc_id": did}, {"doc_id": int(did)}] if str(did).isdigit() else [base]
-    for cond in q:
-        doc = col.find_one(cond, {"_id": 0})
-        if doc:
-            return doc
-    return None
-
-def prepare_tribunal_html_and_roles(full_html: str):
-    """Trim page chrome, keep annotated body, and collect [data-structure] roles."""
+    return col.find_one({"doc_id": {"$in": _doc_id_variants(did)}}, projection or {"_id": 0})
+
+# Rendered views and NER output only change when the stored document does
+VIEW_CACHE_CONTROL = "public, max-age=3600"
+NER_CACHE_CONTROL = "public, max-age=86400"
+
+def _doc_etag(doc_id, content: str, *extra) -> str:
+    """Strong ETag for a document's content (plus anything else that shapes the response)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(doc_id).encode())
+    for part in extra:
+        h.update(b"\0" + str(part).encode("utf-8", errors="replace"))
+    h.update(b"\0" + (content or "").encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+def _trim_outside(container, top_first, top_last):
+    """Drop container's children before top_first and after top_last."""
+    # Prelude first, front to back: each node is then at index 0 when extract() looks it up
+    for node in list(top_first.previous_siblings)[::-1]:
+        node.extract()
+    for node in list(top_last.next_siblings):
+        node.extract()
+
+def _clean_tribunal_container(full_html: str):
+    """Parse and trim page chrome; returns the kept container element (not serialized)."""
     soup = BeautifulSoup(full_html or "", "html.parser")
 
     # If a full page was captured, keep the inner ".judgments" region; else keep body/root.
@@ -63,67 +209,40 @@ def prepare_tribunal_html_and_roles(full_html: str):
     # If annotations exist, trim to first..last annotated block
     annotated = container.select("[data-structure]")
     if annotated:
-        # Trim prelude
-        first = annotated[0]
-        top_first = first
+        top_first = annotated[0]
         while top_first.parent and top_first.parent is not container:
             top_first = top_first.parent
-        for sib in list(top_first.previous_siblings):
-            sib.extract()
-        # Trim tail
-        last = annotated[-1]
-        top_last = last
+        top_last = annotated[-1]
         while top_last.parent and top_last.parent is not container:
             top_last = top_last.parent
-        for sib in list(top_last.next_siblings):
-            sib.extract()
-
-    # Remove common chrome that doesn't contain annotations
-    for sel in [
-        ".header", "header", ".navbar", "#navbar", ".footer", "footer",
-        ".sidebar", "#sidebar", ".adv", ".ads", ".ad", ".share", ".tools",
-        ".translate", "#google_translate_element", ".logo", ".search",
-    ]:
-        for el in container.select(sel):
-            if not el.select_one("[data-structure]"):
-                el.decompose()
-
-    cleaned_html = str(container)
-
-    # Compute role order (first appearance) and assign colors
-    role_order = []
-    seen = set()
-    for el in container.select("[data-structure]"):
-        raw = (el.get("data-structure") or "").strip()
-        k = raw.lower()
-        if raw and k not in seen:
-            seen.add(k)
-            role_order.append(raw)
-
-    palette = [
-        "rgba(96,165,250,.18)",  # blue
-        "rgba(251,191,36,.20)",  # amber
-        "rgba(167,139,250,.18)", # violet
-        "rgba(52,211,153,.18)",  # emerald
-        "rgba(244,114,182,.18)", # pink
-        "rgba(248,113,113,.18)", # red
-        "rgba(56,189,248,.18)",  # sky
-        "rgba(250,204,21,.18)",  # yellow
-        "rgba(163,230,53,.18)",  # lime
-        "rgba(251,113,133,.18)", # rose
-    ]
-    role_colors = {r.lower(): palette[i % len(palette)] for i, r in enumerate(role_order)}
-
-    return cleaned_html, role_order, role_colors
+        _trim_outside(container, top_first, top_last)
+
+    # Remove common chrome that doesn't contain annotations (one selector pass)
+    for el in container.select(CHROME_SEL):
+        if el.decomposed:  # nested inside chrome already removed
+            continue
+        if not el.select_one("[data-structure]"):
+            el.decompose()
+
+    return container
 
 # -----------------------
 # Local safe url_for (shadows Jinja's url_for for this render only)
 # -----------------------
+# Endpoints with no view function in the app; skips raising BuildError on every render
+_UNBUILDABLE: set[str] = set()
+
 def _safe_url_for(endpoint: str, **values) -> str:
     """Return app url or empty string if endpoint doesn't exist (prevents BuildError in template)."""
+    name = f"{request.blueprint or ''}{endpoint}" if endpoint.startswith(".") else endpoint
+    if name in _UNBUILDABLE:
+        return ""
     try:
         return _url_for(endpoint, **values)
     except BuildError:
+        # Only a missing endpoint is cached; a bad or missing argument may build next time
+        if name not in current_app.view_functions:
+            _UNBUILDABLE.add(name)
         return ""  # empty action attr is harmless and keeps page rendering
 
 # -----------------------
@@ -138,18 +257,15 @@ def show_categories():
     Template expects: grouped_data=[{_id: "Tribunals", categories: [..]}]
     """
     try:
-        if _catalog_has("tribunal", "category"):
-            cats = list(
-                db.catalog.find(
-                    {"kind": "tribunal", "level": "category"},
-                    {"_id": 0, "category_name": 1},
-                ).sort("category_name", 1)
-            )
+        cats = _catalog_rows("tribunal", "category", None, {"_id": 0, "category_name": 1}, "category_name")
+        if cats:
             grouped = [{"_id": "Tribunals", "categories": [c["category_name"] for c in cats]}]
         else:
-            # Fallback: group from the main collection
+            # Fallback: group from the main collection. Dedupe (law_type, category_name)
+            # pairs first so only those two fields flow through the pipeline, never `content`.
             pipeline = [
-                {"$group": {"_id": "$law_type", "categories": {"$addToSet": "$category_name"}}},
+                {"$group": {"_id": {"law_type": "$law_type", "category_name": "$category_name"}}},
+                {"$group": {"_id": "$_id.law_type", "categories": {"$addToSet": "$_id.category_name"}}},
                 {"$sort": {"_id": 1}},
             ]
             grouped = list(db.tribunals.aggregate(pipeline))
@@ -169,16 +285,20 @@ def show_years(category_name):
     """
     category_name = unquote(category_name)
     try:
-        if _catalog_has("tribunal", "year", {"category_name": category_name}):
-            years = [
-                d["year"]
-                for d in db.catalog.find(
-                    {"kind": "tribunal", "level": "year", "category_name": category_name},
-                    {"_id": 0, "year": 1},
-                ).sort("year", 1)
+        years = [
+            d["year"]
+            for d in _catalog_rows(
+                "tribunal", "year", {"category_name": category_name}, {"_id": 0, "year": 1}, "year"
+            )
+        ]
+        if not years:
+            # $match on the (category_name, year) index, then group/sort server-side
+            pipeline = [
+                {"$match": {"category_name": category_name}},
+                {"$group": {"_id": "$year"}},
+                {"$sort": {"_id": 1}},
             ]
-        else:
-            years = sorted(db.tribunals.distinct("year", {"category_name": category_name}))
+            years = [d["_id"] for d in db.tribunals.aggregate(pipeline)]
 
         if not years:
             abort(404)
@@ -195,19 +315,14 @@ def list_tribunals_by_year(category_name, year):
     """
     category_name = unquote(category_name)
     try:
-        if _catalog_has("tribunal", "doc", {"category_name": category_name, "year": year}):
-            items = list(
-                db.catalog.find(
-                    {
-                        "kind": "tribunal",
-                        "level": "doc",
-                        "category_name": category_name,
-                        "year": year,
-                    },
-                    {"_id": 0, "doc_id": 1, "full_title": 1},
-                ).sort("full_title", 1)
-            )
-        else:
+        items = _catalog_rows(
+            "tribunal",
+            "doc",
+            {"category_name": category_name, "year": year},
+            {"_id": 0, "doc_id": 1, "full_title": 1},
+            "full_title",
+        )
+        if not items:
             items = list(
                 db.tribunals.find(
                     {"category_name": category_name, "year": year},
@@ -234,10 +349,8 @@ def view_tribunals(doc_id: int):
     """
     try:
         # ❌ REMOVE any child→parent redirect logic here. Just fetch and render.
-        # If your collection sometimes stores doc_id as string, try both:
-        doc = db.tribunals.find_one({"doc_id": doc_id}, {"_id": 0})
-        if not doc:
-            doc = db.tribunals.find_one({"doc_id": str(doc_id)}, {"_id": 0})
+        # If your collection sometimes stores doc_id as string, match both in one query:
+        doc = _find_one_both(db.tribunals, {"doc_id": doc_id})
         if not doc:
             abort(404, description="Tribunal doc not found")
 
@@ -255,22 +368,36 @@ def view_tribunals(doc_id: int):
         cleaned_html = (doc.get("content") or "")
         doc["content"] = cleaned_html
 
+        # Revisits with a matching ETag skip the render entirely
+        etag = _doc_etag(doc["doc_id"], cleaned_html, doc["full_title"], doc["year"],
+                         doc["category_name"], doc["law_type"])
+        if request.if_none_match.contains(etag):
+            resp = make_response("", 304)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = VIEW_CACHE_CONTROL
+            return resp
+
         # Render with a SAFE url_for injected (shadows Flask's url_for only for this render).
         # This prevents BuildError in template when summary blueprint isn't registered.
         try:
-            return render_template(
+            page = render_template(
                 "view_tribunals.html",
                 tribunals=doc,
                 url_for=_safe_url_for,  # NEW: safe override only in this template render
             )
         except TemplateNotFound:
             # (Kept for compatibility; renders the same template name)
-            return render_template(
+            page = render_template(
                 "view_tribunals.html",
                 tribunals=doc,
                 url_for=_safe_url_for,  # NEW
             )
 
+        resp = make_response(page)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = VIEW_CACHE_CONTROL
+        return resp
+
     except Exception as e:
         # Print full traceback to your console so you can see the exact cause
         print("[TRIBUNALS][view_tribunals] EXCEPTION")
@@ -282,15 +409,33 @@ def api_ner_html(doc_id: int):
     """
     API endpoint: returns NER-annotated HTML for a tribunal doc.
     Response: { html: "<annotated html>" }
+    - Add ?model=trf for the slower, higher-quality transformer model.
     """
     try:
-        base = _find_one_both(db.tribunals, {"doc_id": doc_id})
+        base = _find_one_both(db.tribunals, {"doc_id": doc_id}, {"_id": 0, "doc_id": 1, "content": 1})
         if not base:
             abort(404)
 
-        cleaned_html, _, _ = prepare_tribunal_html_and_roles(base.get("content", ""))
-        annotated = _get_ner_engine().annotate_html(cleaned_html) if cleaned_html else ""
-        return jsonify({"html": annotated})
+        model_name = NER_MODEL_HQ if request.args.get("model") == "trf" else NER_MODEL
+
+        # Deterministic per (doc, content, model): a matching ETag skips parse + NER
+        etag = _doc_etag(doc_id, base.get("content", ""), model_name)
+        if request.if_none_match.contains(etag):
+            resp = make_response("", 304)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = NER_CACHE_CONTROL
+            return resp
+
+        # Hand the parsed container to the annotator: serialized once, after annotation
+        container = _clean_tribunal_container(base.get("content", ""))
+        annotated = _annotate_coalesced(container, model_name) if container.contents else str(container)
+        resp = jsonify({"html": annotated})
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = NER_CACHE_CONTROL
+        return resp
+    except FutureTimeout:
+        print(f"[TRIBUNALS][api_ner_html] NER timed out after {NER_TIMEOUT}s (doc {doc_id})")
+        return jsonify({"error": "NER is busy, try again shortly"}), 503
     except Exception as e:
         print(f"[TRIBUNALS][api_ner_html] {e}")
         return jsonify({"error": str(e)}), 500
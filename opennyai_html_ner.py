@@ -1,144 +1,42 @@
-# # opennyai_html_ner.py
-# from __future__ import annotations
-# from typing import Iterable, List, Tuple
-# from bs4 import BeautifulSoup, NavigableString, Tag
-
-# from opennyai import Pipeline
-# from opennyai.utils import Data
-
-# # Tags we should not touch
-# _SKIP = {"script", "style", "noscript", "code", "pre", "svg", "canvas", "iframe"}
-
-# class OpenNyAIHtmlNER:
-#     """
-#     Wraps OpenNyAI NER pipeline and injects spans into HTML text nodes.
-#     Uses official params from docs: sentence-level + postprocess enabled.
-#     """
-#     def __init__(
-#         self,
-#         use_gpu: bool = False,
-#         model_name: str = "en_legal_ner_trf",
-#         ner_mini_batch_size: int = 40000,
-#         verbose: bool = False,
-#     ):
-#         self.pipeline = Pipeline(
-#             components=["NER"],
-#             use_gpu=use_gpu,
-#             verbose=verbose,
-#             ner_model_name=model_name,
-#             ner_mini_batch_size=ner_mini_batch_size,
-#             ner_do_sentence_level=True,
-#             ner_do_postprocess=True,
-#             ner_statute_shortforms_path="",
-#         )
-
-#     def _ents_for_text(self, text: str) -> List[Tuple[int, int, str]]:
-#         """
-#         Run NER on one string and return (start, end, label) spans.
-#         OpenNyAI returns a spaCy Doc in pipeline._ner_model_output.
-#         """
-#         if not text or not text.strip():
-#             return []
-
-#         _ = self.pipeline(Data([text]))  # triggers NER
-#         doc = self.pipeline._ner_model_output[0]  # spaCy Doc
-#         # Ensure sorted, non-overlapping spans
-#         ents = sorted([(e.start_char, e.end_char, e.label_) for e in doc.ents], key=lambda x: (x[0], x[1]))
-#         # Remove overlaps just in case
-#         merged = []
-#         last_end = -1
-#         for s, e, L in ents:
-#             if s >= last_end:
-#                 merged.append((s, e, L))
-#                 last_end = e
-#         return merged
-
-#     def annotate_html(self, html: str, skip_tags: Iterable[str] = _SKIP) -> str:
-#         """
-#         Parse HTML, run NER on visible text nodes, wrap with:
-#           <span class="ner ner-<LABEL>" data-entity="<LABEL>">...</span>
-#         """
-#         soup = BeautifulSoup(html, "html.parser")
-
-#         def should_skip(tag: Tag) -> bool:
-#             return tag.name in skip_tags
-
-#         for text_node in list(soup.find_all(string=True)):
-#             parent = text_node.parent
-#             if not isinstance(parent, Tag) or should_skip(parent):
-#                 continue
-
-#             text = str(text_node)
-#             if len(text.strip()) < 2:
-#                 continue
-
-#             spans = self._ents_for_text(text)
-#             if not spans:
-#                 continue
-
-#             # Rebuild fragments with wrappers
-#             frags: List = []
-#             cur = 0
-#             for start, end, label in spans:
-#                 if start > cur:
-#                     frags.append(NavigableString(text[cur:start]))
-#                 span = soup.new_tag("span")
-#                 span["class"] = ["ner", f"ner-{label}"]
-#                 span["data-entity"] = label
-#                 span.string = text[start:end]
-#                 frags.append(span)
-#                 cur = end
-#             if cur < len(text):
-#                 frags.append(NavigableString(text[cur:]))
-
-#             text_node.replace_with(*frags)
-
-#         return str(soup)
-
-
-# # Convenience helpers
+# opennyai_html_ner.py
+from __future__ import annotations
+import contextlib
+import html as _html
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, List, Tuple, Union
+from bs4 import BeautifulSoup, NavigableString, Tag
 
-# def annotate_one_html(html: str, **ner_kwargs) -> str:
-#     """
-#     One-shot annotate a single HTML string.
-#     Example: annotate_one_html(raw_html, use_gpu=False, model_name="en_legal_ner_trf")
-#     """
-#     engine = OpenNyAIHtmlNER(**ner_kwargs)
-#     return engine.annotate_html(html)
+# libxml2-backed parser when available; html.parser otherwise
+try:
+    import lxml  # noqa: F401
+    _PARSER = "lxml"
+except ImportError:
+    _PARSER = "html.parser"
 
+# whole documents only: lxml wraps fragments in <html><body> and moves their leading
+# <style>/<title>/<meta>/<link>/<script> into a <head>, so fragments use html.parser
+_FULL_DOC_RE = re.compile(r"<(?:!doctype|html|body)\b", re.I)
 
-# def annotate_many_files(paths: List[str], output_dir: str, **ner_kwargs) -> List[str]:
-#     """
-#     Read multiple HTML files, write annotated versions to output_dir.
-#     Returns list of output file paths.
-#     """
-#     import os
-#     os.makedirs(output_dir, exist_ok=True)
-#     engine = OpenNyAIHtmlNER(**ner_kwargs)
-#     out_paths: List[str] = []
-#     for p in paths:
-#         with open(p, "r", encoding="utf-8") as f:
-#             html = f.read()
-#         annotated = engine.annotate_html(html)
-#         out_p = os.path.join(output_dir, os.path.basename(p))
-#         with open(out_p, "w", encoding="utf-8") as f:
-#             f.write(annotated)
-#         out_paths.append(out_p)
-#     return out_paths
+# Components NER-only inference never reads; disabled after load when present
+_UNUSED_PIPES = ("tagger", "morphologizer", "parser", "attribute_ruler", "lemmatizer", "textcat", "senter")
 
+# Text with no capital letter and no digit essentially never holds a legal entity
+# (names, courts, statutes are capitalized; dates/case numbers have digits)
+_CANDIDATE_RE = re.compile(r"[A-Z0-9]")
 
-# # opennyai_html_ner.py
-# from __future__ import annotations
-# from typing import Iterable, List, Tuple
-# from bs4 import BeautifulSoup, NavigableString, Tag
+# Sentence ends used to cut long text nodes into model-sized chunks
+_SENT_END_RE = re.compile(r"[.;?!]\s+")
 
-# _SKIP = {"script", "style", "noscript", "code", "pre", "svg", "canvas", "iframe"}
-# opennyai_html_ner.py (replace the class with this)
-from __future__ import annotations
-from typing import Iterable, List, Tuple
-from bs4 import BeautifulSoup, NavigableString, Tag
+@lru_cache(maxsize=None)
+def _span_open(label: str) -> str:
+    """Opening <span> markup for an entity label (labels are a small fixed set)."""
+    lab = _html.escape(label)
+    return f'<span class="ner ner-{lab}" data-entity="{lab}">'
 
-_SKIP = {"script", "style", "noscript", "code", "pre", "svg", "canvas", "iframe"}
+_SKIP = frozenset({"script", "style", "noscript", "code", "pre", "svg", "canvas", "iframe"})
 
 class OpenNyAIHtmlNER:
     """
@@ -155,7 +53,22 @@ class OpenNyAIHtmlNER:
         do_sentence_level: bool = True,
         do_postprocess: bool = False,   # default OFF to avoid E030 if we ever fall back
         prefer_spacy_direct: bool = True,
+        quantize: bool = False,         # int8 dynamic quantization of transformer Linear layers (CPU)
+        batch_size: int | None = None,  # texts per nlp.pipe batch (default: from ner_mini_batch_size)
+        cache_size: int = 50_000,       # text -> spans LRU entries (0 disables)
+        prefilter: bool = True,         # skip the model for texts with no entity candidate
+        max_chunk_chars: int = 1000,    # longer text nodes are split at sentence ends (0 disables)
     ):
+        self._quantize = quantize
+        self._use_gpu = use_gpu
+        # ner_mini_batch_size is in characters for OpenNyAI; ~1k chars per text for nlp.pipe
+        self.batch_size = batch_size or max(8, ner_mini_batch_size // 1000)
+        self.max_chunk_chars = max_chunk_chars
+        self.prefilter = prefilter
+        # legal HTML repeats a lot of boilerplate text; identical nodes reuse spans
+        self._cache_size = cache_size
+        self._cache: OrderedDict[str, List[Tuple[int, int, str]]] = OrderedDict()
+        self._cache_lock = threading.Lock()
         self._Data = None
         self.pipeline = None     # OpenNyAI pipeline (fallback)
         self._nlp = None         # spaCy model (preferred)
@@ -172,14 +85,68 @@ class OpenNyAIHtmlNER:
         except Exception as e:
             print(f"[NER] Could not add sentencizer: {e}")
 
+    def _disable_unused_pipes(self, nlp):
+        """Skip forward passes of components that don't feed NER; sentencizer replaces parser/senter."""
+        disabled = [name for name in _UNUSED_PIPES if name in nlp.pipe_names]
+        for name in disabled:
+            nlp.disable_pipe(name)
+        if disabled:
+            print(f"[NER] Disabled unused pipes: {disabled}")
+
+    def _add_doc_cleaner(self, nlp):
+        """Drop transformer tensors from each Doc once NER has run (we only read .ents)."""
+        try:
+            if "transformer" in nlp.pipe_names and "doc_cleaner" not in nlp.pipe_names:
+                nlp.add_pipe("doc_cleaner")
+        except Exception as e:
+            print(f"[NER] Could not add doc_cleaner: {e}")
+
+    def _inference(self):
+        """No-autograd context for model calls, with fp16 autocast on GPU."""
+        stack = contextlib.ExitStack()
+        try:
+            import torch
+        except ImportError:
+            return stack
+        stack.enter_context(torch.inference_mode())
+        if self._use_gpu and torch.cuda.is_available():
+            stack.enter_context(torch.autocast("cuda", dtype=torch.float16))
+        return stack
+
+    def _quantize_transformer(self, nlp):
+        """Swap the HF transformer's Linear layers for int8 dynamic-quantized ones."""
+        if "transformer" not in nlp.pipe_names:
+            return
+        try:
+            import torch
+            model = nlp.get_pipe("transformer").model
+            n = 0
+            for node in model.walk():
+                for shim in node.shims:
+                    mod = getattr(shim, "_model", None)
+                    if isinstance(mod, torch.nn.Module):
+                        shim._model = torch.quantization.quantize_dynamic(
+                            mod, {torch.nn.Linear}, dtype=torch.qint8
+                        )
+                        n += 1
+            print(f"[NER] Quantized {n} transformer module(s) to int8.")
+        except Exception as e:
+            print(f"[NER] Could not quantize transformer: {e}")
+
     def _init_pipeline(self, use_gpu, model_name, ner_mini_batch_size, verbose,
                        do_sentence_level, do_postprocess, prefer_spacy_direct):
         # 1) Prefer spaCy direct load of the legal model
         if prefer_spacy_direct:
             try:
                 import spacy
+                if use_gpu:
+                    spacy.require_gpu()  # must precede spacy.load
                 self._nlp = spacy.load(model_name)  # e.g., "en_legal_ner_trf"
+                self._disable_unused_pipes(self._nlp)
                 self._ensure_sentencizer(self._nlp)
+                self._add_doc_cleaner(self._nlp)
+                if self._quantize and not use_gpu:
+                    self._quantize_transformer(self._nlp)
                 self._mode = "spacy"
                 print(f"[NER] Using spaCy model directly: {model_name}")
                 return
@@ -216,16 +183,9 @@ class OpenNyAIHtmlNER:
             self._mode = None
             print(f"[NER] Failed to initialize any model. NER disabled. Cause: {e}")
 
-    def _ents_for_text(self, text: str) -> List[Tuple[int, int, str]]:
-        if not text or not text.strip():
-            return []
-        if self._mode == "spacy" and self._nlp:
-            doc = self._nlp(text)
-        elif self._mode == "opennyai" and self.pipeline:
-            _ = self.pipeline(self._Data([text]))
-            doc = self.pipeline._ner_model_output[0]  # spaCy Doc
-        else:
-            return []
+    @staticmethod
+    def _ents_for_doc(doc) -> List[Tuple[int, int, str]]:
+        """Sorted, non-overlapping (start, end, label) spans of a spaCy Doc."""
         ents = sorted([(e.start_char, e.end_char, e.label_) for e in doc.ents],
                       key=lambda x: (x[0], x[1]))
         merged, last_end = [], -1
@@ -235,43 +195,142 @@ class OpenNyAIHtmlNER:
                 last_end = e
         return merged
 
-    def annotate_html(self, html: str, skip_tags: Iterable[str] = _SKIP) -> str:
-        if not html or (self._mode is None):
-            return html
-        soup = BeautifulSoup(html, "html.parser")
-
-        def should_skip(tag: Tag) -> bool:
-            return tag.name in skip_tags
-
-        for text_node in list(soup.find_all(string=True)):
-            parent = text_node.parent
-            if not isinstance(parent, Tag) or should_skip(parent):
+    def _ents_for_texts(self, texts: List[str], batch_size: int | None = None) -> List[List[Tuple[int, int, str]]]:
+        """Spans for many strings: cached texts are reused, the rest go through the model once each."""
+        if not texts:
+            return []
+        found: dict[str, List[Tuple[int, int, str]]] = {}
+        if self.prefilter:
+            for t in texts:
+                if t not in found and not _CANDIDATE_RE.search(t):
+                    found[t] = []
+        with self._cache_lock:
+            for t in texts:
+                if t not in found and t in self._cache:
+                    self._cache.move_to_end(t)
+                    found[t] = self._cache[t]
+        misses = [t for t in dict.fromkeys(texts) if t not in found]
+        if misses:
+            spans = self._run_model(misses, batch_size)
+            found.update(zip(misses, spans))
+            if self._cache_size > 0:
+                with self._cache_lock:
+                    for t, sp in zip(misses, spans):
+                        self._cache[t] = sp
+                    while len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+        return [found[t] for t in texts]
+
+    @staticmethod
+    def _chunk_text(text: str, limit: int) -> List[Tuple[int, str]]:
+        """(offset, chunk) pieces of text, cut after sentence ends and packed up to ~limit chars."""
+        if limit <= 0 or len(text) <= limit:
+            return [(0, text)]
+        chunks, start, cut = [], 0, 0
+        for m in _SENT_END_RE.finditer(text):
+            end = m.end()
+            if end - start > limit and cut > start:
+                chunks.append((start, text[start:cut]))
+                start = cut
+            cut = end
+        if len(text) - start > limit and start < cut < len(text):
+            chunks.append((start, text[start:cut]))
+            start = cut
+        chunks.append((start, text[start:]))
+        return chunks
+
+    def _run_model(self, texts: List[str], batch_size: int | None = None) -> List[List[Tuple[int, int, str]]]:
+        """Spans for many strings with one batched model run (nlp.pipe, or one OpenNyAI call)."""
+        with self._inference():
+            if self._mode == "spacy" and self._nlp:
+                # short, similar-length sequences batch best through the transformer
+                pieces = [(i, off, chunk) for i, t in enumerate(texts)
+                          for off, chunk in self._chunk_text(t, self.max_chunk_chars)]
+                docs = self._nlp.pipe((c for _, _, c in pieces), batch_size=batch_size or self.batch_size)
+                out: List[List[Tuple[int, int, str]]] = [[] for _ in texts]
+                for (i, off, _), doc in zip(pieces, docs):
+                    out[i].extend((s + off, e + off, L) for s, e, L in self._ents_for_doc(doc))
+                return out
+            elif self._mode == "opennyai" and self.pipeline:
+                _ = self.pipeline(self._Data(texts))
+                docs = self.pipeline._ner_model_output  # one spaCy Doc per text
+            else:
+                return [[] for _ in texts]
+            return [self._ents_for_doc(doc) for doc in docs]
+
+    @staticmethod
+    def _text_nodes(soup: BeautifulSoup, skip_tags: Iterable[str]) -> List[NavigableString]:
+        """Visible text nodes worth sending to the model (none under a skipped tag, at any depth)."""
+        skip = skip_tags if isinstance(skip_tags, frozenset) else frozenset(skip_tags)
+        nodes = []
+        for text_node in soup.find_all(string=True):
+            if not isinstance(text_node.parent, Tag):
                 continue
-            text = str(text_node)
-            if len(text.strip()) < 2:
+            if len(text_node.strip()) < 2:
                 continue
-
-            spans = self._ents_for_text(text)
-            if not spans:
+            if any(p.name in skip for p in text_node.parents):
                 continue
+            nodes.append(text_node)
+        return nodes
+
+    @staticmethod
+    def _wrap_spans(text_node: NavigableString, spans: List[Tuple[int, int, str]]) -> None:
+        """Replace text_node with its entity-wrapped version, built as one escaped string and parsed once."""
+        text = str(text_node)
+        parts: List[str] = []
+        cur = 0
+        for start, end, label in spans:
+            if start > cur:
+                parts.append(_html.escape(text[cur:start], quote=False))
+            parts.append(_span_open(label))
+            parts.append(_html.escape(text[start:end], quote=False))
+            parts.append('</span>')
+            cur = end
+        if cur < len(text):
+            parts.append(_html.escape(text[cur:], quote=False))
+
+        # html.parser keeps a fragment as-is (no <html><body> wrapper, whitespace intact)
+        frag = BeautifulSoup("".join(parts), "html.parser")
+        text_node.replace_with(*list(frag.contents))
 
-            frags: List = []
-            cur = 0
-            for start, end, label in spans:
-                if start > cur:
-                    frags.append(NavigableString(text[cur:start]))
-                span = soup.new_tag("span")
-                span["class"] = ["ner", f"ner-{label}"]
-                span["data-entity"] = label
-                span.string = text[start:end]
-                frags.append(span)
-                cur = end
-            if cur < len(text):
-                frags.append(NavigableString(text[cur:]))
-
-            text_node.replace_with(*frags)
-
-        return str(soup)
+    def annotate_html(self, html: str, skip_tags: Iterable[str] = _SKIP) -> str:
+        if not html or (self._mode is None):
+            return html
+        # all text nodes of the document go through the model in batches
+        return self.annotate_many_html([html], skip_tags)[0]
+
+    def annotate_many_html(self, htmls: List[Union[str, Tag]], skip_tags: Iterable[str] = _SKIP,
+                           batch_size: int | None = None) -> List[str]:
+        """
+        Annotate several HTML documents with one batched model pass over all
+        their text nodes. Returns the annotated documents in input order.
+        An already-parsed Tag may be passed instead of a string; it is annotated
+        in place and serialized once, skipping a str()/re-parse round-trip.
+        """
+        if self._mode is None:
+            return [h if isinstance(h, str) else str(h) for h in htmls]
+        roots: List = []   # parsed roots, serialized whole
+        nodes: List[NavigableString] = []
+        for html in htmls:
+            if isinstance(html, Tag):
+                root = html
+            elif html:
+                root = BeautifulSoup(html, _PARSER if _FULL_DOC_RE.search(html) else "html.parser")
+            else:
+                roots.append(None)
+                continue
+            roots.append(root)
+            nodes.extend(self._text_nodes(root, skip_tags))
+
+        all_spans = self._ents_for_texts([str(n) for n in nodes], batch_size=batch_size)
+        for text_node, spans in zip(nodes, all_spans):
+            if spans:
+                self._wrap_spans(text_node, spans)
+
+        out: List[str] = []
+        for root, html in zip(roots, htmls):
+            out.append(html if root is None else str(root))
+        return out
 
 # convenience helpers unchanged…
 def annotate_one_html(html: str, **ner_kwargs) -> str:
@@ -16,9 +16,11 @@ from pymongo import MongoClient, InsertOne
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "legal_dashboard_db")
 ACTS_COLLECTION = os.getenv("ACTS_COLLECTION", "acts")
+INSERT_CHUNK = 1000  # InsertOne ops per bulk_write
 
 def main():
-    client = MongoClient(MONGO_URI)
+    # one-shot rebuild: primary ack without journal wait; compress the wire when supported
+    client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib")
     db = client[MONGO_DB]
 
     # pick 'acts' defensively (fallback to 'act' if needed)
@@ -34,8 +36,10 @@ def main():
 
     # 2) rebuild section_index
     db.section_index.drop()
-    if ids:
-        db.section_index.bulk_write([InsertOne({"doc_id": _id}) for _id in ids])
+    for i in range(0, len(ids), INSERT_CHUNK):
+        db.section_index.bulk_write(
+            [InsertOne({"doc_id": _id}) for _id in ids[i:i + INSERT_CHUNK]], ordered=False
+        )
     db.section_index.create_index("doc_id", unique=True)
 
     # 3) sanity print
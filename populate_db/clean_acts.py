@@ -1,67 +1,222 @@
+import hashlib
+import multiprocessing
+import os
 import re
-from pymongo import MongoClient
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import MongoClient, UpdateOne
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+# libxml2 tree for full documents when available; BeautifulSoup otherwise
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
+
 # --- CONFIGURATION ---
 MONGO_URI = "mongodb://localhost:27017/"
 DATABASE_NAME = "legal_dashboard_db"
 COLLECTION_NAME = "acts"
-
-def clean_akn_p_content(html_content):
+READ_BATCH_SIZE = 200    # docs per cursor round-trip
+WRITE_BATCH_SIZE = 500   # updates per bulk_write
+WORKERS = os.cpu_count() or 1   # cleaning processes
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and the open find() cursor
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+# Pattern to remove [***] / [ * * * ] etc.
+# (one character class inside the brackets: same matches as \[\s*[\*\s]+\s*\] without
+# the polynomial backtracking on long unclosed whitespace runs)
+STAR_ONLY_PATTERN = re.compile(r'\[[\s*]+\]')
+
+# Pattern to remove ALL nested or single brackets but keep text (e.g., [[hello]] -> hello)
+NESTED_BRACKETS_PATTERN = re.compile(r'\[+([^\[\]\*]+?)\]+')
+
+# Tokens for the single-pass bracket scanner: '[' runs, ']' runs, '*', everything else
+BRACKET_TOKEN_PATTERN = re.compile(r'\[+|\]+|\*|[^\[\]*]+')
+
+# lxml wraps fragments in <html><body> and moves leading <style>/<title>/<meta>/<link>/
+# <script> into a <head>: fragments (the usual stored content) are parsed with html.parser
+FULL_DOC_PATTERN = re.compile(r'<(?:!doctype|html|body)\b', re.I)
+DOCTYPE_PATTERN = re.compile(r'\s*<!doctype\b', re.I)
+
+# Server-side prefilter: only content with an akn-p span is cleaned. Which of those spans
+# change is not decidable by a regex (child tags are flattened, hyphens and brackets may be
+# written as entities), so all of them are read; content without one is skipped unread.
+NEEDS_CLEANUP_FILTER = {"content": {"$regex": "akn-p"}}
+
+def strip_nested_brackets(text):
+    """
+    One-pass equivalent of applying NESTED_BRACKETS_PATTERN until nothing matches.
+    A '[' run is unwrapped together with the ']' run closing it when the content
+    between them is non-empty and holds no '*' and no stray bracket.
+    """
+    if '[' not in text or ']' not in text:
+        return text
+    out = []     # output pieces; each '[' run is its own piece
+    stack = []   # [index of the '[' run in out, still unwrappable]
+    append = out.append
+    for tok in BRACKET_TOKEN_PATTERN.findall(text):
+        c = tok[0]
+        if c == '[':
+            stack.append([len(out), True])
+        elif c == ']' and stack:
+            idx, ok = stack.pop()
+            if ok and len(out) > idx + 1:
+                out[idx] = ''    # drop the '[' run; this ']' run is dropped too
+                continue
+            if stack:
+                stack[-1][1] = False   # enclosing group now holds a stray bracket
+        elif c == '*' and stack:
+            stack[-1][1] = False
+        append(tok)
+    return ''.join(out)
+
+def clean_akn_p_text(text):
     """
-    Cleans <span class="akn-p"> elements in HTML by:
+    Cleans the text of one <span class="akn-p">:
     1. Removing leading hyphens
     2. Removing [***] / [ * * * ] completely (if only * and spaces inside)
     3. Removing all levels of brackets around meaningful content (e.g., [[hello]] → hello)
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Pattern to remove [***] / [ * * * ] etc.
-    star_only_pattern = re.compile(r'\[\s*[\*\s]+\s*\]')
+    # 1. Remove leading hyphen and optional whitespace
+    stripped = text.lstrip()
+    if stripped.startswith('-'):
+        text = stripped[1:].lstrip()
 
-    # Pattern to remove ALL nested or single brackets but keep text (e.g., [[hello]] -> hello)
-    nested_brackets_pattern = re.compile(r'\[+([^\[\]\*]+?)\]+')
+    if '[' in text:
+        # 2. Remove star-only bracketed content
+        text = STAR_ONLY_PATTERN.sub('', text)
 
-    for span in soup.find_all('span', class_='akn-p'):
-        text = span.get_text()
+        # 3. Replace nested brackets while preserving content
+        text = strip_nested_brackets(text)
 
-        # 1. Remove leading hyphen and optional whitespace
-        text = re.sub(r'^\s*-\s*', '', text)
+    return text
 
-        # 2. Remove star-only bracketed content
-        text = star_only_pattern.sub('', text)
+def _is_akn_p(el):
+    return 'akn-p' in (el.get('class') or '').split()
 
-        # 3. Replace nested brackets while preserving content
-        while nested_brackets_pattern.search(text):
-            text = nested_brackets_pattern.sub(r'\1', text)
+def clean_akn_p_content(html_content):
+    """
+    Cleans <span class="akn-p"> elements in HTML (see clean_akn_p_text).
+    Full documents are cleaned on the lxml tree when lxml is installed; fragments (and
+    everything without lxml) with BeautifulSoup's html.parser, which keeps them as they are.
+
+    >>> clean_akn_p_content('<style>p{}</style><title>T</title><p><span class="akn-p">- [a]</span></p>')
+    '<style>p{}</style><title>T</title><p><span class="akn-p">a</span></p>'
+    >>> clean_akn_p_content('<html><body><p><span class="akn-p">- <span class="akn-ref">[1]</span> x</span></p>'
+    ...                     '<p><span class="akn-p">- [y]</span></p></body></html>')
+    '<html><body><p><span class="akn-p">1 x</span></p><p><span class="akn-p">y</span></p></body></html>'
+    """
+    if etree is None or not html_content or not FULL_DOC_PATTERN.search(html_content):
+        return _clean_akn_p_content_bs4(html_content)
+
+    root = etree.fromstring(html_content, LXML_PARSER)
+    if root is None:
+        return html_content
+
+    # snapshot: removing a span's child <span> (e.g. an akn-ref) would end a live iter() early
+    for span in list(root.iter('span')):
+        if not _is_akn_p(span):
+            continue
+        text = ''.join(span.itertext())
+        # like BeautifulSoup's span.string = ...: children are replaced by the text
+        for child in list(span):
+            span.remove(child)
+        span.text = clean_akn_p_text(text)
+
+    # libxml2 invents a default doctype; keep it only if the input had one
+    doctype = root.getroottree().docinfo.doctype if DOCTYPE_PATTERN.match(html_content) else None
+    return etree.tostring(root, method='html', encoding='unicode', doctype=doctype)
+
+def _clean_akn_p_content_bs4(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
 
-        span.string = text
+    for span in soup.find_all('span', class_='akn-p'):
+        span.string = clean_akn_p_text(span.get_text())
 
     return str(soup)
 
+def content_hash(content):
+    """128-bit BLAKE2 digest of the content, stored as content_clean_hash once cleaned."""
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+def _doc_batches(cursor, size):
+    """Yield lists of (_id, content, content_clean_hash) from the cursor, `size` docs at a time."""
+    batch = []
+    for doc in cursor:
+        batch.append((doc["_id"], doc.get("content", ""), doc.get("content_clean_hash")))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _clean_batch(batch):
+    """
+    Worker: clean a batch and return (_id, cleaned or None, hash) for docs needing a write.
+    Docs whose content still matches their stored hash were cleaned by an earlier run and
+    are skipped without parsing; docs that were already clean only get the hash recorded.
+    """
+    writes = []
+    for _id, content, stored_hash in batch:
+        if stored_hash and stored_hash == content_hash(content):
+            continue
+        cleaned = clean_akn_p_content(content)
+        writes.append((_id, cleaned if cleaned != content else None, content_hash(cleaned)))
+    return writes
+
 def update_documents():
     print("🔄 Connecting to MongoDB...")
     client = MongoClient(MONGO_URI)
     db = client[DATABASE_NAME]
     collection = db[COLLECTION_NAME]
 
-    total_docs = collection.count_documents({})
-    print(f"📦 Found {total_docs} documents in '{COLLECTION_NAME}'.")
+    total_docs = collection.count_documents(NEEDS_CLEANUP_FILTER)
+    print(f"📦 Found {total_docs} documents in '{COLLECTION_NAME}' that may need cleaning.")
 
     updated_count = 0
-    cursor = collection.find({}, {"_id": 1, "content": 1})
-
-    for doc in tqdm(cursor, desc="Cleaning <span class='akn-p'>", unit="doc"):
-        old_content = doc.get("content", "")
-        cleaned_content = clean_akn_p_content(old_content)
-
-        if cleaned_content != old_content:
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"content": cleaned_content}}
-            )
-            updated_count += 1
+    ops = []
+    cursor = collection.find(
+        NEEDS_CLEANUP_FILTER, {"_id": 1, "content": 1, "content_clean_hash": 1}, no_cursor_timeout=True
+    ).batch_size(READ_BATCH_SIZE)
+
+    def collect(writes):
+        nonlocal updated_count, ops
+        for _id, cleaned_content, clean_hash in writes:
+            fields = {"content_clean_hash": clean_hash}
+            if cleaned_content is not None:
+                fields["content"] = cleaned_content
+                updated_count += 1
+            ops.append(UpdateOne({"_id": _id}, {"$set": fields}))
+            if len(ops) >= WRITE_BATCH_SIZE:
+                collection.bulk_write(ops, ordered=False)
+                ops = []
+
+    # Clean batches in worker processes; keep a bounded window in flight so the
+    # cursor is read at the pace the workers clean.
+    try:
+        with ProcessPoolExecutor(max_workers=WORKERS, mp_context=MP_CONTEXT) as ex, \
+                tqdm(total=total_docs, desc="Cleaning <span class='akn-p'>", unit="doc") as pbar:
+            pending = deque()
+            for batch in _doc_batches(cursor, READ_BATCH_SIZE):
+                pending.append((len(batch), ex.submit(_clean_batch, batch)))
+                if len(pending) >= WORKERS * 2:
+                    n, fut = pending.popleft()
+                    collect(fut.result())
+                    pbar.update(n)
+            while pending:
+                n, fut = pending.popleft()
+                collect(fut.result())
+                pbar.update(n)
+    finally:
+        cursor.close()
+
+    if ops:
+        collection.bulk_write(ops, ordered=False)
 
     print(f"\n✅ Done. Updated {updated_count} documents with cleaned content.")
     client.close()
@@ -1,12 +1,27 @@
 # main_populate_script.py
 import os
 import csv
+import atexit
+import multiprocessing
 import re
-from pymongo import MongoClient
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from pymongo import MongoClient, InsertOne, ASCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
 from datetime import datetime
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
 from tqdm import tqdm
 
+# libxml2-backed parser when available; html.parser otherwise
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
 # --- CONFIGURATION ---
 # Update these variables to match your setup
 METADATA_CSV_PATH = '/DATACHAI/Final_Data/laws/metadata.csv'
@@ -16,6 +31,22 @@ LOG_FILE_NAME = 'processing_issues.log'
 MONGO_URI = "mongodb://localhost:27017/"
 DATABASE_NAME = "legal_dashboard_db"
 COLLECTION_NAME = "acts"
+INSERT_BATCH_SIZE = 500  # documents per bulk_write
+WORKERS = os.cpu_count() or 1   # processes reading + cleaning HTML files
+ROWS_PER_TASK = 64       # metadata rows per worker task
+QUEUE_MAXSIZE = 512      # cleaned docs waiting for the writer
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and the writer and scan threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+# Compiled once at import; used for every document
+JUNK_SPAN_PATTERN = re.compile(r'^[\*\[\]\{\}\s]+$')
+STAR_BRACKET_PATTERN = re.compile(r'^\*+\s*\[([^\]]+)\]$')
+TRAILING_HYPHEN_PATTERN = re.compile(r'[\u2010-\u2015\-]+$')
+
+# whole documents only go through lxml (fragments: html.parser, see clean_html_content)
+FULL_DOC_PATTERN = re.compile(r'<(?:!doctype|html|body)\b', re.I)
 
 # --- HELPER FUNCTIONS ---
 
@@ -37,43 +68,60 @@ def load_law_type_mapping(filepath):
         print(f"❌ Error reading law type mapping file: {e}")
         return None
 
+_LOG_FILE = None  # opened once by setup_log_file
+_LOG_LOCK = threading.Lock()
+
 def setup_log_file():
-    """Creates and prepares the log file for the current run."""
+    """Creates and prepares the log file for the current run; it stays open until exit."""
+    global _LOG_FILE
     try:
-        with open(LOG_FILE_NAME, 'w', encoding='utf-8') as log_file:
-            log_file.write(f"--- Data Population Log ---\n")
-            log_file.write(f"Run started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log_file.write("-" * 30 + "\n\n")
+        _LOG_FILE = open(LOG_FILE_NAME, 'w', encoding='utf-8')
+        atexit.register(_LOG_FILE.close)
+        _LOG_FILE.write(f"--- Data Population Log ---\n")
+        _LOG_FILE.write(f"Run started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        _LOG_FILE.write("-" * 30 + "\n\n")
         print(f"📝 Log file '{LOG_FILE_NAME}' created for processing issues.")
     except Exception as e:
         print(f"❌ Could not create log file: {e}")
 
 def log_issue(issue_type, detail):
-    """Appends an issue to the log file."""
+    """Appends an issue to the log file (the main process and writer thread share one handle)."""
+    line = f"[{issue_type.upper()}]: {detail}\n"
     try:
-        with open(LOG_FILE_NAME, 'a', encoding='utf-8') as log_file:
-            log_file.write(f"[{issue_type.upper()}]: {detail}\n")
+        with _LOG_LOCK:
+            if _LOG_FILE is not None:
+                _LOG_FILE.write(line)
+            else:
+                with open(LOG_FILE_NAME, 'a', encoding='utf-8') as log_file:
+                    log_file.write(line)
     except Exception as e:
         print(f"   ❌ Error writing to log file: {e}")
 
+def iter_html_files(root_folder):
+    """Yields paths of all .html files under root_folder (iterative os.scandir, no per-file stat)."""
+    stack = [root_folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.html'):
+                        yield entry.path
+        except OSError as e:
+            log_issue("Scan Error", f"Could not list {current}: {e}")
+
 def get_all_html_files(root_folder):
-    """Walks through a directory and returns a set of all .html filenames."""
-    html_files = set()
+    """
+    Returns a set of all .html files under root_folder as paths relative to it
+    (category_folder/year/filename), so same-named files in different years don't collide.
+    """
     print(f"🔍 Scanning '{root_folder}' for all .html files...")
-    for dirpath, _, filenames in os.walk(root_folder):
-        for f in filenames:
-            if f.endswith('.html'):
-                html_files.add(f)
+    html_files = {os.path.relpath(path, root_folder) for path in iter_html_files(root_folder)}
     print(f"   -> Found {len(html_files)} total .html files on disk.")
     return html_files
 
-def calculate_word_count(html_string):
-    """Removes HTML tags and returns the word count of the plain text."""
-    plain_text = re.sub('<[^<]+?>', ' ', html_string)
-    words = plain_text.split()
-    return len(words)
-
-
 def clean_html_content(html_content):
     """
     Cleans HTML using BeautifulSoup:
@@ -84,47 +132,206 @@ def clean_html_content(html_content):
     - Cleans text like "*** [Mizoram;]" → "Mizoram;"
     - Removes bracket-only <span class="akn-p"> like '[', ']', ']', ']}}'
     - Strips trailing hyphens from all text nodes
+    Returns (cleaned_html, word_count); the count comes from the cleaned tree's text.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # 1. Remove <span class="akn-remark">
-    for span in soup.find_all('span', class_='akn-remark'):
-        span.decompose()
-
-    # 2. Remove <span> containing <a class="akn-ref">
-    for a in soup.find_all('a', class_='akn-ref'):
-        if a.parent and a.parent.name == 'span':
-            a.parent.decompose()
-
-    # 3. Remove <span class="akn-p">References</span>
-    for span in soup.find_all('span', string='References'):
-        if 'akn-p' in (span.get('class') or []):
+    # fragments keep html.parser: lxml would move their leading <style>/<title>/<meta>/
+    # <link>/<script> into an invented <head>
+    soup = BeautifulSoup(html_content, HTML_PARSER if FULL_DOC_PATTERN.search(html_content) else 'html.parser')
+
+    # 1-2: one walk over the spans for the structural removals, which must
+    # happen before any akn-p text is inspected
+    for span in soup.find_all('span'):
+        if span.decomposed:
+            continue  # removed along with an enclosing span
+        # 1. Remove <span class="akn-remark">
+        if 'akn-remark' in (span.get('class') or ()):
+            span.decompose()
+        # 2. Remove <span> containing <a class="akn-ref">
+        elif any(child.name == 'a' and 'akn-ref' in (child.get('class') or ())
+                 for child in span.contents if isinstance(child, Tag)):
             span.decompose()
 
-    # 4. Remove <span class="akn-p"> containing only brackets/braces/asterisks (e.g., [* * *], ], }})
-    junk_pattern = re.compile(r'^[\*\[\]\{\}\s]+$')
+    # 3-5: one walk over the remaining <span class="akn-p">
     for span in soup.find_all('span', class_='akn-p'):
-        if junk_pattern.match(span.get_text(strip=True)):
+        if span.decomposed or span.parent is None:
+            continue  # removed, or replaced by an enclosing span's new text
+
+        # 3. Remove <span class="akn-p">References</span>
+        if span.string == 'References':
             span.decompose()
+            continue
 
-    # 5. Fix spans like: "*** [Mizoram;]" → "Mizoram;"
-    cleanup_star_bracket_pattern = re.compile(r'^\*+\s*\[([^\]]+)\]$')
-    for span in soup.find_all('span', class_='akn-p'):
         text = span.get_text(strip=True)
-        match = cleanup_star_bracket_pattern.match(text)
+
+        # 4. Remove <span class="akn-p"> containing only brackets/braces/asterisks (e.g., [* * *], ], }})
+        if JUNK_SPAN_PATTERN.match(text):
+            span.decompose()
+            continue
+
+        # 5. Fix spans like: "*** [Mizoram;]" → "Mizoram;"
+        match = STAR_BRACKET_PATTERN.match(text)
         if match:
-            cleaned = match.group(1).strip()
-            span.string = cleaned
+            span.string = match.group(1).strip()
 
     # 6. Remove trailing hyphens from all string text
     for text_node in soup.find_all(string=True):
         if text_node.strip().endswith('-'):
-            cleaned = re.sub(r'[\u2010-\u2015\-]+$', '', text_node.strip())
+            cleaned = TRAILING_HYPHEN_PATTERN.sub('', text_node.strip())
             text_node.replace_with(cleaned)
 
-    return str(soup)
+    # words are counted on the tree already in memory instead of regex-stripping the output
+    word_count = len(soup.get_text(' ').split())
+
+    return str(soup), word_count
+
+
+
+
+@lru_cache(maxsize=None)
+def act_folder(category_folder, year_str):
+    """Directory holding one category's files for one year (few distinct pairs, many rows)."""
+    return os.path.join(MAIN_DOCUMENTS_FOLDER, category_folder, year_str)
+
+
+def build_act_document(row, law_type_map):
+    """
+    Reads and cleans the HTML file for one metadata row.
+    Returns (document, None), or (None, (issue_type, detail)) if the file is missing/unreadable.
+    """
+    doc_id_str = row['doc_id']
+    year_str = row['year']
+    full_title = row['full_title']
+    category = row['category']
+    category_folder = row['category_folder']
+    filename = row['filename']
+    law_type = law_type_map.get(category, "Uncategorized")
+
+    html_file_path = os.path.join(act_folder(category_folder, year_str), filename)
+
+    try:
+        # one C-level UTF-8 decode instead of TextIOWrapper's incremental decoder
+        with open(html_file_path, 'rb') as html_file:
+            html_content = html_file.read().decode('utf-8')
+    except FileNotFoundError:
+        return None, ("File Not Found", html_file_path)
+    except Exception as e:
+        return None, ("File Read Error", f"Could not read {html_file_path}: {e}")
+
+    cleaned_html_content, word_count = clean_html_content(html_content)
+
+    return {
+        'doc_id': int(doc_id_str),
+        'full_title': full_title,
+        'category': category,
+        'year': int(year_str),
+        'law_type': law_type,
+        'word_count': word_count,
+        'content': cleaned_html_content
+    }, None
+
+
+def ensure_indexes(col):
+    """Indexes the acts routes query on; built once after the bulk load."""
+    try:
+        col.create_index([("doc_id", ASCENDING)], unique=True, name="doc_id_unique")
+    except OperationFailure as e:
+        # duplicate doc_ids in metadata.csv: keep lookups fast, log the conflict
+        print(f"⚠️ Could not build unique doc_id index ({e}); creating a non-unique one.")
+        log_issue("Index Error", f"doc_id not unique: {e}")
+        col.create_index([("doc_id", ASCENDING)], name="doc_id_idx")
+    col.create_index([("category", ASCENDING), ("year", ASCENDING)], name="category_year_idx")
+
+
+INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression', 'collation',
+                 'weights', 'default_language', 'language_override')
+
+def restore_indexes(col, saved_indexes):
+    """Recreates indexes captured before the load that ensure_indexes didn't already build."""
+    existing = list(col.list_indexes())
+    names = {ix['name'] for ix in existing}
+    key_specs = {tuple(ix['key'].items()) for ix in existing}
+    for ix in saved_indexes:
+        # same keys under another name would be rejected by the server (IndexOptionsConflict)
+        if ix['name'] in names or tuple(ix['key'].items()) in key_specs:
+            continue
+        key = ix['key']
+        if '_fts' in key:
+            # text index: the stored key is internal; rebuild from its weighted fields
+            keys = [(k, v) for k, v in key.items() if k not in ('_fts', '_ftsx')]
+            keys += [(field, 'text') for field in ix.get('weights', {})]
+        else:
+            keys = list(key.items())
+        options = {k: v for k, v in ix.items() if k in INDEX_OPTIONS}
+        try:
+            col.create_index(keys, name=ix['name'], **options)
+        except OperationFailure as e:
+            print(f"⚠️ Could not restore index '{ix['name']}': {e}")
+            log_issue("Index Error", f"restore '{ix['name']}' failed: {e}")
+            continue
+        print(f"   -> Restored index '{ix['name']}'.")
+
+
+def process_row(row, law_type_map):
+    """
+    Worker: builds the document for one metadata row.
+    Returns (status, doc, issue): ("ok", doc, None), ("missing", None, issue) if the
+    file could not be read, or ("bad_row", None, issue) if the row lacks a column.
+    Issues are logged by the main process, so workers never touch the log file.
+    """
+    try:
+        doc, issue = build_act_document(row, law_type_map)
+    except KeyError as e:
+        return "bad_row", None, ("CSV Column Error", f"Missing column in metadata.csv row: {e}")
+    return ("ok", doc, None) if doc is not None else ("missing", None, issue)
 
 
+def process_rows(rows, law_type_map):
+    """Worker: process_row over a chunk of rows; returns [(row, status, doc, issue), ...]."""
+    return [(row, *process_row(row, law_type_map)) for row in rows]
+
+
+def row_chunks(reader, size):
+    """Yields lists of up to `size` rows from the CSV reader."""
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def insert_writer(collection, doc_queue, stats):
+    """
+    Single writer thread: drains the queue and inserts in batches of INSERT_BATCH_SIZE.
+    A None on the queue means the producers are done.
+    """
+    batch = []
+
+    def flush():
+        try:
+            result = collection.bulk_write([InsertOne(doc) for doc in batch], ordered=False,
+                                           bypass_document_validation=True)
+            stats['inserted'] += result.inserted_count
+        except BulkWriteError as e:
+            stats['inserted'] += e.details.get('nInserted', 0)
+            for err in e.details.get('writeErrors', []):
+                failed = batch[err['index']]
+                log_issue("Insert Error", f"doc_id {failed.get('doc_id')} ({failed.get('full_title')}): {err.get('errmsg')}")
+        except Exception as e:
+            log_issue("Insert Error", f"Batch of {len(batch)} document(s) failed: {e}")
+        batch.clear()
+
+    while True:
+        doc = doc_queue.get()
+        if doc is None:
+            break
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
 
 
 # --- MAIN SCRIPT LOGIC ---
@@ -143,7 +350,9 @@ def populate_acts_collection():
         return
 
     try:
-        client = MongoClient(MONGO_URI)
+        # Bulk loader: primary ack without journal wait, compressed wire, room for the writer + readers
+        client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib",
+                             maxPoolSize=50, retryWrites=False)
         db = client[DATABASE_NAME]
         acts_collection = db[COLLECTION_NAME]
         client.admin.command('ping')
@@ -155,75 +364,89 @@ def populate_acts_collection():
     try:
         delete_result = acts_collection.delete_many({})
         print(f"🧹 Cleared existing data. {delete_result.deleted_count} documents removed from '{COLLECTION_NAME}'.")
+        # Secondary indexes are rebuilt after the load instead of updated per insert
+        saved_indexes = [ix for ix in acts_collection.list_indexes() if ix['name'] != '_id_']
+        acts_collection.drop_indexes()
     except Exception as e:
         print(f"❌ Error clearing collection: {e}")
         client.close()
         return
 
+    # The disk scan for the coverage check doesn't depend on the load: run it alongside
+    scan_pool = ThreadPoolExecutor(max_workers=1)
+    disk_scan = scan_pool.submit(get_all_html_files, MAIN_DOCUMENTS_FOLDER)
+
     print(f"📂 Reading metadata from '{METADATA_CSV_PATH}'...")
-    successful_inserts = 0
     failed_files = 0
     inserted_filenames = set()
+    stats = {'inserted': 0}
+
+    # Worker processes read + clean files (BeautifulSoup is CPU-bound); the main
+    # process hands documents to one writer thread through a bounded queue, so
+    # parsing overlaps with Mongo round-trips.
+    doc_queue = queue.Queue(maxsize=QUEUE_MAXSIZE)
+    writer = threading.Thread(target=insert_writer, args=(acts_collection, doc_queue, stats), daemon=True)
+    writer.start()
 
     try:
         with open(METADATA_CSV_PATH, mode='r', encoding='utf-8') as csvfile:
-            csv_rows = list(csv.DictReader(csvfile))
-
-            for row in tqdm(csv_rows, desc="Populating Database", unit="docs"):
-                try:
-                    doc_id_str = row['doc_id']
-                    year_str = row['year']
-                    full_title = row['full_title']
-                    category = row['category']
-                    category_folder = row['category_folder']
-                    filename = row['filename']
-                    law_type = law_type_map.get(category, "Uncategorized")
-
-                    if law_type == "Uncategorized":
-                        log_issue("Missing Law Type", f"Category '{category}' not found in law_types.csv.")
-
-                    html_file_path = os.path.join(MAIN_DOCUMENTS_FOLDER, category_folder, year_str, filename)
-
-                    try:
-                        with open(html_file_path, 'r', encoding='utf-8') as html_file:
-                            html_content = html_file.read()
-                    except FileNotFoundError:
-                        log_issue("File Not Found", html_file_path)
-                        failed_files += 1
-                        continue
-                    except Exception as e:
-                        log_issue("File Read Error", f"Could not read {html_file_path}: {e}")
-                        failed_files += 1
-                        continue
-
-                    cleaned_html_content = clean_html_content(html_content)
-                    word_count = calculate_word_count(cleaned_html_content)
-
-                    document_to_insert = {
-                        'doc_id': int(doc_id_str),
-                        'full_title': full_title,
-                        'category': category,
-                        'year': int(year_str),
-                        'law_type': law_type,
-                        'word_count': word_count,
-                        'content': cleaned_html_content
-                    }
-
-                    acts_collection.insert_one(document_to_insert)
-                    inserted_filenames.add(filename)
-                    successful_inserts += 1
-
-                except KeyError as e:
-                    log_issue("CSV Column Error", f"Missing column in metadata.csv row: {e}")
-                    continue
+            # Rows are streamed; a quick line count only sizes the progress bar
+            total_rows = max(sum(1 for _ in csvfile) - 1, 0)
+            csvfile.seek(0)
+            reader = csv.DictReader(csvfile)
+            categories = set()
+
+            def collect(results):
+                nonlocal failed_files
+                for row, status, doc, issue in results:
+                    if status == "ok":
+                        doc_queue.put(doc)
+                        inserted_filenames.add(os.path.join(row['category_folder'], row['year'], row['filename']))
+                    else:
+                        log_issue(*issue)
+                        if status == "missing":
+                            failed_files += 1
+
+            # Keep a bounded window of chunks in flight so rows are read at the
+            # pace the workers clean them
+            with ProcessPoolExecutor(max_workers=WORKERS, mp_context=MP_CONTEXT) as ex, \
+                    tqdm(total=total_rows, desc="Populating Database", unit="docs") as pbar:
+                pending = deque()
+                for chunk in row_chunks(reader, ROWS_PER_TASK):
+                    categories.update(row.get('category') for row in chunk)
+                    pending.append((len(chunk), ex.submit(process_rows, chunk, law_type_map)))
+                    if len(pending) >= WORKERS * 2:
+                        n, fut = pending.popleft()
+                        collect(fut.result())
+                        pbar.update(n)
+                while pending:
+                    n, fut = pending.popleft()
+                    collect(fut.result())
+                    pbar.update(n)
+
+        # Unmapped categories are logged once each here, not once per row in the workers
+        for category in sorted(categories - set(law_type_map) - {None}):
+            log_issue("Missing Law Type", f"Category '{category}' not found in law_types.csv.")
 
     except FileNotFoundError:
         print(f"❌ Critical Error: Metadata file not found at '{METADATA_CSV_PATH}'.")
     except Exception as e:
         print(f"❌ An unexpected error occurred during CSV processing: {e}")
+    finally:
+        doc_queue.put(None)
+        writer.join()
+    successful_inserts = stats['inserted']
+
+    print("🗂️ Building indexes...")
+    try:
+        ensure_indexes(acts_collection)
+        restore_indexes(acts_collection, saved_indexes)
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
 
     print("\n--- Verifying File Coverage ---")
-    all_disk_files = get_all_html_files(MAIN_DOCUMENTS_FOLDER)
+    all_disk_files = disk_scan.result()
+    scan_pool.shutdown()
     unpopulated_files = all_disk_files - inserted_filenames
 
     if not unpopulated_files:
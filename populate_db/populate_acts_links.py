@@ -1,38 +1,102 @@
 # populate_db/populate_act_links.py
 
+import atexit
 import os
-import re
-from pymongo import MongoClient
+from pymongo import MongoClient, InsertOne, ASCENDING
+from pymongo.errors import BulkWriteError
 from bs4 import BeautifulSoup
 from datetime import datetime
 from tqdm import tqdm 
 
+# Only hrefs are needed: read them straight off an lxml tree when available
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
+
 # --- CONFIGURATION ---
 MONGO_URI = "mongodb://localhost:27017/"
 DATABASE_NAME = "legal_dashboard_db"
 SOURCE_COLLECTION = "acts"
 TARGET_COLLECTION = "document_links"
 LOG_FILE_NAME = 'link_processing_log.log'
+INSERT_BATCH_SIZE = 10000  # link documents per bulk_write
+READ_BATCH_SIZE = 20      # acts per cursor round-trip (content is large)
+
+_LOG_FILE = None  # opened once by setup_log_file
 
 def setup_log_file():
-    """Creates and prepares the log file for the current run."""
+    """Creates and prepares the log file for the current run; it stays open until exit."""
+    global _LOG_FILE
     try:
-        with open(LOG_FILE_NAME, 'w', encoding='utf-8') as log_file:
-            log_file.write(f"--- Link Processing Log ---\n")
-            log_file.write(f"Run started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log_file.write("-" * 30 + "\n\n")
+        _LOG_FILE = open(LOG_FILE_NAME, 'w', encoding='utf-8')
+        atexit.register(_LOG_FILE.close)
+        _LOG_FILE.write(f"--- Link Processing Log ---\n")
+        _LOG_FILE.write(f"Run started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        _LOG_FILE.write("-" * 30 + "\n\n")
         print(f"📝 Log file '{LOG_FILE_NAME}' created for processing issues.")
     except Exception as e:
         print(f"❌ Could not create log file: {e}")
 
 def log_issue(issue_type, detail):
     """Appends an issue to the log file."""
+    line = f"[{issue_type.upper()}]: {detail}\n"
     try:
-        with open(LOG_FILE_NAME, 'a', encoding='utf-8') as log_file:
-            log_file.write(f"[{issue_type.upper()}]: {detail}\n")
+        if _LOG_FILE is not None:
+            _LOG_FILE.write(line)
+        else:
+            with open(LOG_FILE_NAME, 'a', encoding='utf-8') as log_file:
+                log_file.write(line)
     except Exception as e:
         print(f"   ❌ Error writing to log file: {e}")
 
+def extract_hrefs(html_content, doc_id=None):
+    """Returns the href of every <a> in the HTML."""
+    if etree is not None:
+        try:
+            try:
+                root = etree.fromstring(html_content, LXML_PARSER)
+            except ValueError:
+                # str content with an <?xml encoding=...?> declaration: lxml wants bytes
+                root = etree.fromstring(html_content.encode('utf-8'), LXML_PARSER)
+            return root.xpath('//a/@href') if root is not None else []
+        except (etree.ParserError, ValueError) as e:
+            log_issue("Parse Error", f"doc_id {doc_id}: lxml could not parse content ({e}); using html.parser")
+    soup = BeautifulSoup(html_content, 'html.parser')
+    return [link['href'] for link in soup.find_all('a', href=True)]
+
+def parse_doc_link(href):
+    """
+    Returns the number in the first '/doc/<digits>' of href, or None.
+    Same result as re.search(r'/doc/(\\d+)', href), without the regex engine.
+    """
+    i = href.find('/doc/')
+    while i != -1:
+        j = k = i + 5
+        n = len(href)
+        while k < n and href[k].isdecimal():
+            k += 1
+        if k > j:
+            return int(href[j:k])
+        i = href.find('/doc/', i + 1)
+    return None
+
+def flush_links(collection, pending, stats):
+    """Inserts the buffered link documents in one round trip and updates the insert count."""
+    if not pending:
+        return
+    try:
+        result = collection.bulk_write([InsertOne(link) for link in pending], ordered=False,
+                                       bypass_document_validation=True)
+        stats['inserted'] += result.inserted_count
+    except BulkWriteError as bwe:
+        stats['inserted'] += bwe.details.get('nInserted', 0)
+        for err in bwe.details.get('writeErrors', []):
+            failed = pending[err['index']]
+            log_issue("Insert Error", f"link {failed.get('parent_doc_id')} -> {failed.get('doc_id')}: {err.get('errmsg')}")
+    pending.clear()
+
 def extract_and_populate_links():
     """
     Connects to MongoDB, finds all inter-act links, and populates a new collection.
@@ -42,7 +106,8 @@ def extract_and_populate_links():
 
     # --- 1. ESTABLISH MONGODB CONNECTION ---
     try:
-        client = MongoClient(MONGO_URI)
+        # One-shot loader: primary ack without journal wait, compressed wire
+        client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib", retryWrites=False)
         db = client[DATABASE_NAME]
         source_collection = db[SOURCE_COLLECTION]
         target_collection = db[TARGET_COLLECTION]
@@ -63,55 +128,76 @@ def extract_and_populate_links():
 
     # --- 3. PROCESS EACH DOCUMENT IN THE SOURCE COLLECTION ---
     total_links_found = 0
+    stats = {'inserted': 0}
     docs_processed = 0
+    pending_links = []
     
-    # Use a cursor to iterate through all documents in the 'acts' collection
-    for act_document in tqdm(source_collection.find({}, {'doc_id': 1, 'content': 1}) , desc = "Processing : "):
-        parent_doc_id = act_document.get('doc_id')
-        html_content = act_document.get('content')
-
-        if not parent_doc_id or not html_content:
-            log_issue("Missing Data", f"Skipping document due to missing 'doc_id' or 'content'.")
-            continue
-
-        # Use BeautifulSoup to parse the HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Find all anchor tags with an 'href' attribute
-        links = soup.find_all('a', href=True)
-        
-        links_in_doc = 0
-        for link in links:
-            href = link['href']
-            # Use regex to find links that match the pattern '/doc/some_number'
-            match = re.search(r'/doc/(\d+)', href)
-            
-            if match:
-                # The extracted doc_id from the link
-                linked_doc_id = int(match.group(1))
-                
-                # Prepare the document for the new collection
-                link_document = {
-                    'doc_id': linked_doc_id,
-                    'parent_doc_id': parent_doc_id,
-                    'type': SOURCE_COLLECTION # As requested, the type is 'acts'
-                }
-                
-                # Insert the new document into the 'act_links' collection
-                target_collection.insert_one(link_document)
-                total_links_found += 1
-                links_in_doc += 1
-
-        
-        
-        docs_processed += 1
+    # Stream the 'acts' collection through an aggregation: only acts whose HTML has a
+    # '/doc/<number>' link leave the server, and small batches keep the driver from
+    # pre-buffering hundreds of MB of HTML
+    pipeline = [
+        {'$match': {'content': {'$regex': r'/doc/\d'}}},
+        {'$project': {'_id': 0, 'doc_id': 1, 'content': 1}},
+    ]
+    with source_collection.aggregate(pipeline, allowDiskUse=True, batchSize=READ_BATCH_SIZE) as cursor:
+        for act_document in tqdm(cursor, desc = "Processing : "):
+            parent_doc_id = act_document.get('doc_id')
+            html_content = act_document.get('content')
+
+            if not parent_doc_id or not html_content:
+                log_issue("Missing Data", f"Skipping document due to missing 'doc_id' or 'content'.")
+                continue
+
+            # Find the href of every anchor tag
+            hrefs = extract_hrefs(html_content, parent_doc_id)
+
+            links_in_doc = 0
+            seen_in_doc = set()  # repeated cross-references yield one link
+            for href in hrefs:
+                # Links to other documents look like '/doc/some_number'
+                linked_doc_id = parse_doc_link(href)
+
+                if linked_doc_id is not None and linked_doc_id not in seen_in_doc:
+                    seen_in_doc.add(linked_doc_id)
+
+                    # Prepare the document for the new collection
+                    link_document = {
+                        'doc_id': linked_doc_id,
+                        'parent_doc_id': parent_doc_id,
+                        'type': SOURCE_COLLECTION # As requested, the type is 'acts'
+                    }
+
+                    # Buffer for the 'document_links' collection; written in batches
+                    pending_links.append(link_document)
+                    if len(pending_links) >= INSERT_BATCH_SIZE:
+                        flush_links(target_collection, pending_links, stats)
+                    total_links_found += 1
+                    links_in_doc += 1
+
+
+
+            docs_processed += 1
+
+    flush_links(target_collection, pending_links, stats)
+
+    # Lookup indexes are built once the collection is loaded, not maintained per insert
+    try:
+        # not unique: document_links is shared with step4/step5, whose (kind, doc_id) rows
+        # repeat these (parent_doc_id, doc_id) pairs; links are already deduplicated per act
+        target_collection.create_index([('parent_doc_id', ASCENDING), ('doc_id', ASCENDING)],
+                                       name='parent_doc_idx')
+        target_collection.create_index([('doc_id', ASCENDING)], name='doc_id_idx')
+        print("🗂️ Indexes on '(parent_doc_id, doc_id)' and 'doc_id' are in place.")
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
 
     # --- 4. CLOSE CONNECTION AND REPORT SUMMARY ---
     client.close()
     print("\n--- Script Finished ---")
     print(f"📊 Summary:")
-    print(f"   - Total documents processed: {docs_processed}")
-    print(f"   - Total inter-act links found and inserted: {total_links_found}")
+    print(f"   - Total documents with links processed: {docs_processed}")
+    print(f"   - Total inter-act links found (unique per document): {total_links_found}")
+    print(f"   - Total inter-act links inserted: {stats['inserted']}")
     print("✅ MongoDB connection closed.")
 
 # --- RUN THE SCRIPT ---
@@ -24,13 +24,21 @@ Judgments (SC)
   {kind:"judgment", level:"doc",  year, doc_id, full_title, coll:"judgments"}
 
 Notes:
-- Uses batched bulk upserts for speed.
+- Uses batched bulk upserts for speed. Rows go through the client rather than a
+  $merge stage: $merge needs a unique index on its 'on' fields and rejects rows
+  missing any of them, while catalog kinds are keyed by different fields
+  (act_category vs category_name, no category for judgments).
 - Optional DROP/CLEAR flags for 'catalog' only.
+- CAT_BUILD_SOURCE_INDEXES=1 adds covering indexes on the source collections.
+- CAT_DELTA_ONLY=1 (acts, tribunals) only reads source docs whose catalog doc row is
+  missing or has another title; the comparison runs on the server ($lookup).
 """
 
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import MongoClient, UpdateOne
-from pymongo.errors import BulkWriteError
+from pymongo.errors import BulkWriteError, OperationFailure
 
 # ---------- CONFIG ----------
 MONGO_URI   = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
@@ -45,13 +53,23 @@ DO_ACTS       = os.getenv("CAT_DO_ACTS",       "1").lower() in ("1","true","yes"
 DO_TRIBUNALS  = os.getenv("CAT_DO_TRIBUNALS",  "1").lower() in ("1","true","yes")
 DO_JUDGMENTS  = os.getenv("CAT_DO_JUDGMENTS",  "1").lower() in ("1","true","yes")
 
+# Opt-in: covering indexes on the source collections so the doc-row scans read only the index
+BUILD_SOURCE_INDEXES = os.getenv("CAT_BUILD_SOURCE_INDEXES", "0").lower() in ("1","true","yes")
+
+# Opt-in: on an existing catalog, only send rows for new or retitled docs
+DELTA_ONLY = os.getenv("CAT_DELTA_ONLY", "0").lower() in ("1","true","yes")
+
 # Creating per-doc rows can be large; keep batches modest
 BATCH_SIZE = int(os.getenv("CAT_BATCH_SIZE", "5000"))
+FLUSH_WORKERS = 4   # concurrent bulk_write calls
+MAX_INFLIGHT  = 8   # queued batches before the cursor loop waits
 # ---------------------------
 
 
 def connect():
-    client = MongoClient(MONGO_URI)
+    # room for the flush threads to each hold a connection; bulk rebuild: primary ack
+    # without journal wait, compressed wire
+    client = MongoClient(MONGO_URI, maxPoolSize=16, w=1, journal=False, compressors="zstd,zlib")
     db = client[DB_NAME]
     client.admin.command("ping")
     return client, db
@@ -79,19 +97,51 @@ def ensure_indexes(db):
         name="level_doc_lookup",
         partialFilterExpression={"level": "doc"}
     )
+    # Each index below serves one (kind, level) slice: partial on that slice, so it
+    # only holds those rows and the (kind, level) prefix is left out of the key.
     # Acts
-    c.create_index([("kind",1), ("level",1), ("act_category",1)], name="act_cat")
-    c.create_index([("kind",1), ("level",1), ("act_category",1), ("year",1)], name="act_cat_year")
-    c.create_index([("kind",1), ("level",1), ("act_category",1), ("year",1), ("doc_id",1)], name="act_cat_year_doc")
+    _partial_index(c, [("act_category",1)], "act_cat", "act", "category")
+    _partial_index(c, [("act_category",1), ("year",1)], "act_cat_year", "act", "year")
+    _partial_index(c, [("act_category",1), ("year",1), ("doc_id",1)], "act_cat_year_doc", "act", "doc")
 
     # Tribunals
-    c.create_index([("kind",1), ("level",1), ("category_name",1)], name="trib_cat")
-    c.create_index([("kind",1), ("level",1), ("category_name",1), ("year",1)], name="trib_cat_year")
-    c.create_index([("kind",1), ("level",1), ("category_name",1), ("year",1), ("doc_id",1)], name="trib_cat_year_doc")
+    _partial_index(c, [("category_name",1)], "trib_cat", "tribunal", "category")
+    _partial_index(c, [("category_name",1), ("year",1)], "trib_cat_year", "tribunal", "year")
+    _partial_index(c, [("category_name",1), ("year",1), ("doc_id",1)], "trib_cat_year_doc", "tribunal", "doc")
+    # list page: equality on (category_name, year), sorted by full_title
+    _partial_index(c, [("category_name",1), ("year",1), ("full_title",1)], "trib_cat_year_title", "tribunal", "doc")
 
     # Judgments (SC)
-    c.create_index([("kind",1), ("level",1), ("year",1)], name="judg_year")
-    c.create_index([("kind",1), ("level",1), ("year",1), ("doc_id",1)], name="judg_year_doc")
+    _partial_index(c, [("year",1)], "judg_year", "judgment", "year")
+    _partial_index(c, [("year",1), ("doc_id",1)], "judg_year_doc", "judgment", "doc")
+
+
+def _partial_index(c, keys, name, kind, level):
+    """Create an index over the rows of one (kind, level), replacing an older full index of that name."""
+    opts = {"name": name, "partialFilterExpression": {"kind": kind, "level": level}}
+    try:
+        c.create_index(keys, **opts)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+            raise
+        c.drop_index(name)
+        c.create_index(keys, **opts)
+
+
+def ensure_source_indexes(db):
+    """Indexes covering the single-scan projection of each source collection."""
+    print("📚 Ensuring source collection indexes …")
+    specs = [
+        ("acts",      [("category",1), ("year",1), ("doc_id",1), ("full_title",1)], "cat_cat_year_doc_title"),
+        ("tribunals", [("category_name",1), ("year",1), ("doc_id",1), ("full_title",1)], "cat_trib_year_doc_title"),
+        ("judgments", [("year",1), ("doc_id",1), ("full_title",1)], "cat_year_doc_title"),
+    ]
+    for coll, keys, name in specs:
+        try:
+            db[coll].create_index(keys, name=name)
+        except OperationFailure as e:
+            # e.g. over-long titles on servers that enforce the index key size limit
+            print(f"⚠️  Could not build {name} on {coll}: {e}")
 
 
 def bulk_upsert(col, ops):
@@ -106,140 +156,160 @@ def bulk_upsert(col, ops):
         return 0
 
 
+def chunked(it, n):
+    """Yield lists of up to n items from the iterable, holding one list at a time."""
+    buf = []
+    for x in it:
+        buf.append(x)
+        if len(buf) == n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def upsert_all(col, ops):
+    """
+    Stream UpdateOne ops from a generator into bulk_upsert, BATCH_SIZE at a time.
+    Batches are written by FLUSH_WORKERS threads while the cursor keeps reading;
+    at most MAX_INFLIGHT batches are queued, and all are written before returning.
+    """
+    with ThreadPoolExecutor(max_workers=FLUSH_WORKERS) as pool:
+        futures = deque()
+        for batch in chunked(ops, BATCH_SIZE):
+            futures.append(pool.submit(bulk_upsert, col, batch))
+            if len(futures) >= MAX_INFLIGHT:
+                futures.popleft().result()
+        while futures:
+            futures.popleft().result()
+
+
+def source_docs(src, kind, cat_field, cat_key):
+    """
+    Cursor over (doc_id, full_title, <cat_field>, year) of a source collection.
+    With DELTA_ONLY (and a catalog that was not just dropped/cleared), docs whose
+    catalog doc row already exists with the same title are filtered out on the server.
+    Their category and year rows were written with that doc row, so nothing is lost.
+    """
+    proj = {"_id":0, "doc_id":1, "full_title":1, cat_field:1, "year":1}
+    if not DELTA_ONLY or DROP_CATALOG or CLEAR_CATALOG:
+        return src.find({}, proj).batch_size(BATCH_SIZE)
+    pipeline = [
+        {"$project": proj},
+        {"$lookup": {
+            "from": CATALOG_COLL,
+            "let": {"d": "$doc_id", "c": f"${cat_field}", "y": "$year", "t": "$full_title"},
+            "pipeline": [
+                {"$match": {"kind": kind, "level": "doc", "$expr": {"$and": [
+                    {"$eq": [f"${cat_key}", "$$c"]},
+                    {"$eq": ["$year", "$$y"]},
+                    {"$eq": ["$doc_id", "$$d"]},
+                    {"$eq": ["$full_title", "$$t"]},
+                ]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}},
+            ],
+            "as": "hit",
+        }},
+        {"$match": {"hit": {"$size": 0}}},
+        {"$project": {"hit": 0}},
+    ]
+    return src.aggregate(pipeline, allowDiskUse=True, batchSize=BATCH_SIZE)
+
+
 def populate_acts(db):
     catalog = db[CATALOG_COLL]
     acts = db["acts"]
 
-    # 1) category rows
-    print("🧭 Acts: categories …")
-    ops = []
-    for cat in acts.distinct("category"):
-        if not cat:
-            continue
-        filt = {"kind":"act","level":"category","act_category":cat}
-        ops.append(UpdateOne(filt, {"$set": filt}, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops); ops = []
-
-    # 2) (category, year) rows
-    print("🧭 Acts: (category, year) …")
-    pipeline = [
-        {"$group": {"_id": {"category":"$category", "year":"$year"}}},
-        {"$project": {"_id":0, "act_category":"$_id.category", "year":"$_id.year"}},
-    ]
-    for row in acts.aggregate(pipeline, allowDiskUse=True):
-        cat = row.get("act_category"); yr = row.get("year")
-        if cat is None or yr is None:
-            continue
-        filt = {"kind":"act","level":"year","act_category":cat,"year":int(yr)}
-        ops.append(UpdateOne(filt, {"$set": filt}, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops); ops = []
-
-    # 3) doc rows (list page)
-    print("🧭 Acts: doc rows …")
-    cur = acts.find(
-        {},
-        {"_id":0, "doc_id":1, "full_title":1, "category":1, "year":1}
-    ).batch_size(BATCH_SIZE)
-    for doc in cur:
-        did = doc.get("doc_id"); cat = doc.get("category"); yr = doc.get("year")
-        title = doc.get("full_title")
-        if did is None or cat is None or yr is None:
-            continue
-        filt = {"kind":"act","level":"doc","act_category":cat,"year":int(yr),"doc_id":int(did)}
-        setv = {"$set":{"full_title":title, "coll":"acts"}}
-        ops.append(UpdateOne(filt, setv, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops)
+    # category, (category, year) and doc rows from a single scan of acts
+    def ops():
+        seen_cats, seen_cat_years = set(), set()
+        cur = source_docs(acts, "act", "category", "act_category")
+        for doc in cur:
+            did = doc.get("doc_id"); cat = doc.get("category"); yr = doc.get("year")
+            title = doc.get("full_title")
+            if cat and cat not in seen_cats:
+                seen_cats.add(cat)
+                filt = {"kind":"act","level":"category","act_category":cat}
+                yield UpdateOne(filt, {"$setOnInsert": filt}, upsert=True)
+            if cat is None or yr is None:
+                continue
+            yr = int(yr)
+            if (cat, yr) not in seen_cat_years:
+                seen_cat_years.add((cat, yr))
+                filt = {"kind":"act","level":"year","act_category":cat,"year":yr}
+                yield UpdateOne(filt, {"$setOnInsert": filt}, upsert=True)
+            if did is None:
+                continue
+            # doc rows (list page)
+            filt = {"kind":"act","level":"doc","act_category":cat,"year":yr,"doc_id":int(did)}
+            setv = {"$set":{"full_title":title, "coll":"acts"}}
+            yield UpdateOne(filt, setv, upsert=True)
+
+    print("🧭 Acts: categories, (category, year) and doc rows …")
+    upsert_all(catalog, ops())
 
 
 def populate_tribunals(db):
     catalog = db[CATALOG_COLL]
     trib = db["tribunals"]
 
-    # 1) categories
-    print("🏛️ Tribunals: categories …")
-    ops = []
-    for cat in trib.distinct("category_name"):
-        if not cat:
-            continue
-        filt = {"kind":"tribunal","level":"category","category_name":cat}
-        ops.append(UpdateOne(filt, {"$set": filt}, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops); ops = []
-
-    # 2) (category, year)
-    print("🏛️ Tribunals: (category, year) …")
-    pipeline = [
-        {"$group": {"_id": {"category_name":"$category_name", "year":"$year"}}},
-        {"$project": {"_id":0, "category_name":"$_id.category_name", "year":"$_id.year"}},
-    ]
-    for row in trib.aggregate(pipeline, allowDiskUse=True):
-        cat = row.get("category_name"); yr = row.get("year")
-        if cat is None or yr is None:
-            continue
-        filt = {"kind":"tribunal","level":"year","category_name":cat,"year":int(yr)}
-        ops.append(UpdateOne(filt, {"$set": filt}, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops); ops = []
-
-    # 3) doc rows
-    print("🏛️ Tribunals: doc rows …")
-    cur = trib.find(
-        {},
-        {"_id":0, "doc_id":1, "full_title":1, "category_name":1, "year":1}
-    ).batch_size(BATCH_SIZE)
-    for doc in cur:
-        did = doc.get("doc_id"); cat = doc.get("category_name"); yr = doc.get("year")
-        title = doc.get("full_title")
-        if did is None or cat is None or yr is None:
-            continue
-        filt = {"kind":"tribunal","level":"doc","category_name":cat,"year":int(yr),"doc_id":int(did)}
-        setv = {"$set":{"full_title":title, "coll":"tribunals"}}
-        ops.append(UpdateOne(filt, setv, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops)
+    # categories, (category, year) and doc rows from a single scan of tribunals
+    def ops():
+        seen_cats, seen_cat_years = set(), set()
+        cur = source_docs(trib, "tribunal", "category_name", "category_name")
+        for doc in cur:
+            did = doc.get("doc_id"); cat = doc.get("category_name"); yr = doc.get("year")
+            title = doc.get("full_title")
+            if cat and cat not in seen_cats:
+                seen_cats.add(cat)
+                filt = {"kind":"tribunal","level":"category","category_name":cat}
+                yield UpdateOne(filt, {"$setOnInsert": filt}, upsert=True)
+            if cat is None or yr is None:
+                continue
+            yr = int(yr)
+            if (cat, yr) not in seen_cat_years:
+                seen_cat_years.add((cat, yr))
+                filt = {"kind":"tribunal","level":"year","category_name":cat,"year":yr}
+                yield UpdateOne(filt, {"$setOnInsert": filt}, upsert=True)
+            if did is None:
+                continue
+            filt = {"kind":"tribunal","level":"doc","category_name":cat,"year":yr,"doc_id":int(did)}
+            setv = {"$set":{"full_title":title, "coll":"tribunals"}}
+            yield UpdateOne(filt, setv, upsert=True)
+
+    print("🏛️ Tribunals: categories, (category, year) and doc rows …")
+    upsert_all(catalog, ops())
 
 
 def populate_judgments(db):
     catalog = db[CATALOG_COLL]
     judg = db["judgments"]
 
-    # 1) year rows
-    print("⚖️  Judgments: years …")
-    ops = []
-    for yr in judg.distinct("year"):
-        if yr is None:
-            continue
-        filt = {"kind":"judgment","level":"year","year":int(yr)}
-        ops.append(UpdateOne(filt, {"$set": filt}, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops); ops = []
-
-    # 2) doc rows
-    print("⚖️  Judgments: doc rows …")
-    cur = judg.find(
-        {},
-        {"_id":0, "doc_id":1, "full_title":1, "year":1}
-    ).batch_size(BATCH_SIZE)
-    for doc in cur:
-        did = doc.get("doc_id"); yr = doc.get("year"); title = doc.get("full_title")
-        if did is None or yr is None:
-            continue
-        filt = {"kind":"judgment","level":"doc","year":int(yr),"doc_id":int(did)}
-        setv = {"$set":{"full_title":title, "coll":"judgments"}}
-        ops.append(UpdateOne(filt, setv, upsert=True))
-        if len(ops) >= BATCH_SIZE:
-            bulk_upsert(catalog, ops); ops = []
-    bulk_upsert(catalog, ops)
+    # year and doc rows from a single scan of judgments
+    def ops():
+        seen_years = set()
+        cur = judg.find(
+            {},
+            {"_id":0, "doc_id":1, "full_title":1, "year":1}
+        ).batch_size(BATCH_SIZE)
+        for doc in cur:
+            did = doc.get("doc_id"); yr = doc.get("year"); title = doc.get("full_title")
+            if yr is None:
+                continue
+            yr = int(yr)
+            if yr not in seen_years:
+                seen_years.add(yr)
+                filt = {"kind":"judgment","level":"year","year":yr}
+                yield UpdateOne(filt, {"$setOnInsert": filt}, upsert=True)
+            if did is None:
+                continue
+            filt = {"kind":"judgment","level":"doc","year":yr,"doc_id":int(did)}
+            setv = {"$set":{"full_title":title, "coll":"judgments"}}
+            yield UpdateOne(filt, setv, upsert=True)
+
+    print("⚖️  Judgments: years and doc rows …")
+    upsert_all(catalog, ops())
 
 
 def main():
@@ -247,6 +317,8 @@ def main():
     try:
         drop_or_clear(db)
         ensure_indexes(db)
+        if BUILD_SOURCE_INDEXES:
+            ensure_source_indexes(db)
 
         if DO_ACTS:
             populate_acts(db)
@@ -18,67 +18,232 @@ MongoDB (legal_dashboard_db.district_court) document:
   year: int,
   law_type: "judgments",            # << as requested
   word_count: int,
+  content_blob: str                 # _id of the full HTML in district_court_blob
+}
+
+MongoDB (legal_dashboard_db.district_court_blob) document:
+{
+  _id: str,                         # BLAKE2 digest of the HTML (identical HTML stored once)
   content: str                      # full HTML
 }
 """
 
+import codecs
+import hashlib
+import io
+import mmap
+import multiprocessing
 import os
 import re
 import csv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Tuple, Dict, List
+from operator import itemgetter
+from typing import Any, Optional, Tuple, Dict, List, NamedTuple
 from html import unescape
 
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+
+# C CSV parser for the download logs when pandas is installed; csv module otherwise
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# libxml2 text extraction for word counts when available; regex stripping otherwise
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
 
 # ===== CONFIG =====
 DOC_ROOT   = "/DATACHAI/Data/Judments/District_court"
 MONGO_URI  = "mongodb://localhost:27017/"
 DB_NAME    = "legal_dashboard_db"
 COLL_NAME  = "district_court"        # collection name
+BLOB_COLL_NAME = "district_court_blob"  # HTML payloads, keyed by content hash
 
 DROP_COLLECTION  = False             # True to drop collection before ingest
 CLEAR_COLLECTION = False             # True to delete all docs before ingest
 
 MAX_HTML_BYTES = 15_000_000
-FALLBACK_ENCODINGS = ["utf-8-sig", "utf-8", "cp1252", "latin-1"]
+DEFAULT_ENCODING = "utf-8-sig"  # files without a byte-order mark
+MMAP_MIN_BYTES = 64 * 1024  # larger files are decoded straight from a read-only mmap
+BULK_SIZE = 500                      # upserts per bulk_write / documents per insert_many
+FLUSH_WORKERS = 4                    # concurrent bulk_write calls
+MAX_INFLIGHT  = 8                    # queued batches before reading waits
+IO_WORKERS    = 32                   # threads reading HTML files (storage-latency bound)
+WC_WORKERS    = os.cpu_count() or 1  # processes word-counting HTML
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and the flush and read threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+READ_AHEAD    = 64                   # files read / counted ahead of the Mongo writes
+# build the secondary indexes once after the load instead of maintaining them per write
+BUILD_INDEXES_AFTER = os.getenv("DC_BUILD_INDEXES_AFTER", "1").lower() in ("1", "true", "yes")
 # ==================
 
+CSV_COLUMNS = {                      # row field -> CSV header aliases, first non-empty wins
+    "year":   ("year", "Year"),
+    "doc_id": ("doc_id", "Doc_id", "id"),
+    "title":  ("title", "Title"),
+}
+CSV_HEADERS = {h for aliases in CSV_COLUMNS.values() for h in aliases}
 
-def read_text_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
-    for enc in FALLBACK_ENCODINGS:
-        try:
-            return p.read_text(encoding=enc, errors="replace"), enc
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return None, None
 
+class CsvRow(NamedTuple):
+    """One usable CSV row (fields in CSV_COLUMNS order)."""
+    year: str
+    doc_id: str
+    title: str
 
+
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9 ]+")
+# script/style elements with their bodies, else any single tag: one scan instead of three
+MARKUP_PATTERN    = re.compile(r"(?is)<script[^>]*>.*?</script>|<style[^>]*>.*?</style>|<[^>]+>")
+WORD_PATTERN      = re.compile(r"\b\w+\b")
+# norm_key's NON_ALNUM_PATTERN as a str.translate table, for ASCII input
+ASCII_NON_ALNUM_TABLE = {c: " " for c in range(128) if not ("a" <= chr(c) <= "z" or "0" <= chr(c) <= "9")}
+
+
+def sniff_encoding(head: bytes) -> str:
+    """Encoding named by a byte-order mark; DEFAULT_ENCODING (decoded with errors="replace") otherwise."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return DEFAULT_ENCODING
+
+
+def read_text_file(p: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Read once, decoding with the encoding sniffed from the BOM. Files of MMAP_MIN_BYTES or
+    more are decoded straight from a read-only mmap (no intermediate bytes copy), with
+    newlines translated as text mode does.
+    """
+    try:
+        with open(p, "rb") as raw:
+            if os.fstat(raw.fileno()).st_size < MMAP_MIN_BYTES:
+                enc = sniff_encoding(raw.peek(4)[:4])
+                with io.TextIOWrapper(raw, encoding=enc, errors="replace") as f:
+                    return f.read(), enc
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                enc = sniff_encoding(mm[:4])
+                text = str(mm, enc, "replace")
+    except Exception:
+        return None, None
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, enc
+
+
+@lru_cache(maxsize=1_000_000)
 def norm_key(s: str) -> str:
-    """Normalize so CSV title and filename stem compare equal."""
+    """Normalize so CSV title and filename stem compare equal (memoized: titles repeat across years)."""
     s = (s or "").strip().lower()
     s = unescape(s)
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"[\u2018\u2019\u201C\u201D]", "'", s)   # curly → straight
-    s = re.sub(r"[^a-z0-9 ]+", " ", s)                 # keep alnum + spaces
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # keep alnum + spaces (curly quotes and all other punctuation become spaces), collapse runs
+    if s.isascii():
+        return " ".join(s.translate(ASCII_NON_ALNUM_TABLE).split())
+    return " ".join(NON_ALNUM_PATTERN.sub(" ", s).split())
 
 
-def html_to_text(html: str) -> str:
-    """Minimal HTML→text for word count."""
-    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
-    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
-    html = re.sub(r"(?s)<[^>]+>", " ", html)
-    txt = unescape(html)
-    txt = re.sub(r"\s+", " ", txt).strip()
-    return txt
+def count_words(text: str) -> int:
+    """Number of WORD_PATTERN matches, counted without building the list of words."""
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
 
 
 def word_count_from_html(html: str) -> int:
-    return len(re.findall(r"\b\w+\b", html_to_text(html)))
+    if etree is not None and html:
+        try:
+            try:
+                root = etree.fromstring(html, LXML_PARSER)
+            except ValueError:
+                # str content with an <?xml encoding=...?> declaration: lxml wants bytes
+                root = etree.fromstring(html.encode("utf-8", errors="replace"), LXML_PARSER)
+        except (etree.ParserError, ValueError):
+            root = None
+        if root is not None:
+            etree.strip_elements(root, "script", "style", with_tail=False)
+            # element text only (comments and processing instructions are not words), counted
+            # per text node as it is walked: no joined copy of the document text
+            return sum(map(count_words, root.itertext(etree.Element)))
+    # whitespace collapsing does not change the count: skip it
+    return count_words(unescape(MARKUP_PATTERN.sub(" ", html)))
+
+
+def content_hash(html: str) -> str:
+    """128-bit BLAKE2 digest of the HTML: its _id in the blob collection."""
+    return hashlib.blake2b(html.encode("utf-8", errors="replace"), digest_size=16).hexdigest()
+
+
+def utf8_size(s: str) -> int:
+    """
+    UTF-8 size of s for the MAX_HTML_BYTES check, without encoding s when its code point count
+    decides: exact for ASCII (an O(1) flag), a lower bound once over the cap (>= 1 byte per
+    code point), an upper bound when even 4 bytes per code point stays within it.
+    """
+    n = len(s)
+    if s.isascii() or n > MAX_HTML_BYTES:
+        return n
+    if n * 4 <= MAX_HTML_BYTES:
+        return n * 4
+    return len(s.encode("utf-8", errors="replace"))
+
+
+def read_html(p: str, stored_hash: Optional[str] = None) -> Tuple[Optional[str], int, Optional[str]]:
+    """
+    Read one HTML file -> (html, size in bytes, content hash).
+    html is None if the file is unreadable or too big (hash None too), or if its hash
+    equals stored_hash, i.e. the stored content is already current.
+    """
+    try:
+        html_bytes = os.stat(p).st_size
+    except OSError:
+        return None, 0, None
+    if html_bytes > MAX_HTML_BYTES:
+        return None, html_bytes, None  # too big on disk: not read at all
+    html, _ = read_text_file(p)
+    if not html:
+        return None, 0, None
+    # decoded UTF-8 is at most 3 bytes per raw byte: only re-measure when that could pass the cap
+    if html_bytes * 3 > MAX_HTML_BYTES:
+        html_bytes = utf8_size(html)
+        if html_bytes > MAX_HTML_BYTES:
+            return None, html_bytes, None
+    digest = content_hash(html)
+    if digest == stored_hash:
+        return None, html_bytes, digest
+    return html, html_bytes, digest
+
+
+def load_htmls(tasks: List[Tuple[str, Optional[str]]], io_pool, wc_pool):
+    """
+    Yield (html, html_bytes, content hash, word_count) for each (path, stored hash), in order.
+    Two-stage pipeline: I/O threads read up to READ_AHEAD files ahead, and each changed
+    file read is handed to the worker processes for word counting while more are read.
+    """
+    reads, counts = deque(), deque()
+    pending = iter(tasks)
+    while True:
+        while len(reads) < READ_AHEAD:
+            task = next(pending, None)
+            if task is None:
+                break
+            reads.append(io_pool.submit(read_html, *task))
+        if not reads and not counts:
+            return
+        if reads:
+            html, html_bytes, digest = reads.popleft().result()
+            wc = wc_pool.submit(word_count_from_html, html) if html else None
+            counts.append((html, html_bytes, digest, wc))
+        if len(counts) >= READ_AHEAD or not reads:
+            html, html_bytes, digest, wc = counts.popleft()
+            yield html, html_bytes, digest, (wc.result() if wc else 0)
 
 
 def pick_csv_in(court_dir: Path) -> Optional[Path]:
@@ -90,66 +255,137 @@ def pick_csv_in(court_dir: Path) -> Optional[Path]:
     return (pri or cands)[0]
 
 
-def load_csv_rows(csv_path: Path) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    for enc in FALLBACK_ENCODINGS:
+def load_csv_rows_pandas(csv_path: Path, enc: str) -> List[CsvRow]:
+    """load_csv_rows on pandas' C parser: alias resolution and filtering run column-wise."""
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, usecols=lambda c: c in CSV_HEADERS,
+                     encoding=enc, encoding_errors="replace")
+    out = pd.DataFrame(index=df.index)
+    for field, aliases in CSV_COLUMNS.items():
+        col = pd.Series("", index=df.index, dtype=object)
+        for h in reversed(aliases):
+            if h in df.columns:
+                v = df[h].fillna("")
+                col = v.where(v != "", col)
+        out[field] = col.astype(str).str.strip()
+    out = out[(out["year"] != "") & (out["doc_id"] != "") & (out["title"] != "")]
+    return list(map(CsvRow._make, out.itertuples(index=False, name=None)))
+
+
+def load_csv_rows(csv_path: Path) -> List[CsvRow]:
+    with open(csv_path, "rb") as f:
+        enc = sniff_encoding(f.read(4))
+    if pd is not None:
         try:
-            with open(csv_path, newline="", encoding=enc, errors="replace") as f:
-                reader = csv.DictReader(f)
-                for r in reader:
-                    rows.append({
-                        "year":   (r.get("year")   or r.get("Year")   or "").strip(),
-                        "doc_id": (r.get("doc_id") or r.get("Doc_id") or r.get("id") or "").strip(),
-                        "title":  (r.get("title")  or r.get("Title")  or "").strip(),
-                    })
-            break
-        except UnicodeDecodeError:
-            continue
-    return [r for r in rows if r["year"] and r["doc_id"] and r["title"]]
-
-
-def build_year_index(year_dir: Path) -> Dict[str, Path]:
+            return load_csv_rows_pandas(csv_path, enc)
+        except Exception as e:
+            print(f"   ⚠️ pandas could not parse {csv_path.name} ({e}), using csv module")
+    rows: List[CsvRow] = []
+    with open(csv_path, newline="", encoding=enc, errors="replace") as f:
+        reader = csv.reader(f)
+        pos = {h: i for i, h in enumerate(next(reader, []))}  # repeated header: last column, as DictReader
+        cols = [[pos[h] for h in aliases if h in pos] for aliases in CSV_COLUMNS.values()]
+        if not all(cols):
+            return rows
+        if all(len(c) == 1 for c in cols):
+            # one header per field (the usual log file): plain positional picks
+            get = itemgetter(*(c[0] for c in cols))
+            width = max(c[0] for c in cols) + 1
+            for r in reader:
+                if len(r) >= width:
+                    year, doc_id, title = get(r)
+                    row = CsvRow(year.strip(), doc_id.strip(), title.strip())
+                    if row.year and row.doc_id and row.title:
+                        rows.append(row)
+            return rows
+        for r in reader:
+            n = len(r)
+            # first non-empty alias per field
+            row = CsvRow(*(next((r[i] for i in c if i < n and r[i]), "").strip() for c in cols))
+            if row.year and row.doc_id and row.title:
+                rows.append(row)
+    return rows
+
+
+def build_year_index(year_dir: Path) -> Dict[str, str]:
     """
-    Map normalized filename stem -> Path for all .html/.htm in the year folder.
+    Map normalized filename stem -> path for all .html/.htm in the year folder.
     Prefer .html over .htm if both exist.
+    Walks with os.scandir: entry types come from the directory read, no stat per file.
     """
-    idx: Dict[str, Path] = {}
-    for p in year_dir.rglob("*"):
-        if not p.is_file():
-            continue
-        if p.suffix.lower() not in (".html", ".htm"):
-            continue
-        key = norm_key(p.stem)
-        if key not in idx or (p.suffix.lower() == ".html" and idx[key].suffix.lower() == ".htm"):
-            idx[key] = p
+    idx: Dict[str, str] = {}
+    is_html: Dict[str, bool] = {}
+    stack = [str(year_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    continue
+                name = e.name.lower()
+                if name.endswith(".html"):
+                    html = True
+                elif name.endswith(".htm"):
+                    html = False
+                else:
+                    continue
+                if not e.is_file():
+                    continue
+                key = norm_key(e.name[:e.name.rfind(".")])
+                if key not in idx or (html and not is_html[key]):
+                    idx[key] = e.path
+                    is_html[key] = html
     return idx
 
 
 def connect_collection():
-    client = MongoClient(MONGO_URI)
+    # one connection per flush thread; bulk load: primary ack without journal wait,
+    # compressed wire (HTML compresses well)
+    client = MongoClient(MONGO_URI, maxPoolSize=16, w=1, journal=False, compressors="zstd,zlib")
     db = client[DB_NAME]
     col = db[COLL_NAME]
+    blob_col = db[BLOB_COLL_NAME]
     client.admin.command("ping")
-    return client, col
+    return client, col, blob_col
 
 
-def drop_or_clear(col):
+def drop_or_clear(col, blob_col):
     if DROP_COLLECTION:
-        print(f"🗑️  Dropping {DB_NAME}.{COLL_NAME} …")
+        print(f"🗑️  Dropping {DB_NAME}.{COLL_NAME} and {BLOB_COLL_NAME} …")
         col.drop()
+        blob_col.drop()
     elif CLEAR_COLLECTION:
-        print(f"🧹 Clearing {DB_NAME}.{COLL_NAME} …")
+        print(f"🧹 Clearing {DB_NAME}.{COLL_NAME} and {BLOB_COLL_NAME} …")
         res = col.delete_many({})
+        blob_col.delete_many({})
         print(f"   removed {res.deleted_count} docs.")
     else:
         print("🚫 Drop/Clear: skipped")
 
 
-def ensure_indexes(col):
-    print("📚 Ensuring indexes …")
-    # Unique doc per (court folder, doc_id)
+def ensure_blob_collection(blob_col):
+    """Create the blob collection with zstd block compression (HTML compresses several-fold)."""
+    db = blob_col.database
+    if BLOB_COLL_NAME in db.list_collection_names():
+        return
+    print(f"🗜️  Creating {DB_NAME}.{BLOB_COLL_NAME} with zstd block compression …")
+    try:
+        db.create_collection(
+            BLOB_COLL_NAME,
+            storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}},
+        )
+    except OperationFailure as e:
+        # non-WiredTiger engine or server built without zstd: default compressor
+        print(f"   ⚠️ zstd not available ({e}); using the server default.")
+
+
+def ensure_indexes(col, secondary: bool = True):
+    print("📚 Ensuring indexes …" if secondary else "📚 Ensuring upsert key index …")
+    # Unique doc per (court folder, doc_id); upserts look documents up by it, so it
+    # always exists before writing
     col.create_index([("category_name", ASCENDING), ("doc_id", ASCENDING)],
                      unique=True, name="court_doc_unique")
+    if not secondary:
+        return
     # Year filter index
     col.create_index([("year", ASCENDING)], name="year_idx")
     # Optional: quick filter by court+year
@@ -157,16 +393,83 @@ def ensure_indexes(col):
                      name="court_year_idx")
 
 
+def flush_upserts(col, ops: List[UpdateOne], blob_col=None, blob_ops: Optional[List[UpdateOne]] = None) -> int:
+    """
+    Send a batch of upserts in one unordered bulk_write; returns the number of failed ops.
+    blob_ops (the HTML payloads the batch points to) are written first.
+    """
+    failed = 0
+    for target, batch in ((blob_col, blob_ops), (col, ops)):
+        if not batch:
+            continue
+        try:
+            target.bulk_write(batch, ordered=False, bypass_document_validation=True)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            print(f"   ⚠️ BulkWriteError: {len(errors)} failed, e.g. {errors[:3]} …")
+            failed += len(errors)
+    return failed
+
+
+def flush_inserts(col, docs: List[Dict[str, Any]]) -> int:
+    """
+    insert_many a batch of documents expected to be new (no per-doc lookup on the server).
+    Docs that hit court_doc_unique are upserted instead. Returns the number of failed docs.
+    """
+    if not docs:
+        return 0
+    try:
+        col.insert_many(docs, ordered=False, bypass_document_validation=True)
+        return 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+    # insert_many set an _id on every doc; the upsert must not try to change the stored one
+    dup_ops = [
+        UpdateOne({"category_name": docs[err["index"]]["category_name"], "doc_id": docs[err["index"]]["doc_id"]},
+                  {"$set": {k: v for k, v in docs[err["index"]].items() if k != "_id"}},
+                  upsert=True)
+        for err in errors if err.get("code") == 11000
+    ]
+    failed = len(errors) - len(dup_ops)
+    if failed:
+        print(f"   ⚠️ insert_many: {failed} failed, e.g. {[err for err in errors if err.get('code') != 11000][:3]} …")
+    if dup_ops:
+        try:
+            col.bulk_write(dup_ops, ordered=False, bypass_document_validation=True)
+        except BulkWriteError as e:
+            upsert_errors = e.details.get("writeErrors", [])
+            print(f"   ⚠️ BulkWriteError: {len(upsert_errors)} failed, e.g. {upsert_errors[:3]} …")
+            failed += len(upsert_errors)
+    return failed
+
+
 def ingest():
     root = Path(DOC_ROOT).resolve()
     if not root.exists():
         print(f"❌ DOC_ROOT not found: {root}")
         return
 
-    client, col = connect_collection()
+    client, col, blob_col = connect_collection()
+    # batches are written by a few threads while the next files are read
+    pool = ThreadPoolExecutor(max_workers=FLUSH_WORKERS)
+    inflight = deque()
+    # file reads wait on storage (threads); word counts are CPU-bound (processes)
+    io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS)
+    wc_pool = ProcessPoolExecutor(max_workers=WC_WORKERS, mp_context=MP_CONTEXT)
+
+    def drain(limit: int) -> int:
+        """Wait for queued batches until at most `limit` remain; returns their failed ops."""
+        failed = 0
+        while len(inflight) > limit:
+            failed += inflight.popleft().result()
+        return failed
+
     try:
-        drop_or_clear(col)
-        ensure_indexes(col)
+        drop_or_clear(col, blob_col)
+        ensure_blob_collection(blob_col)
+        ensure_indexes(col, secondary=not BUILD_INDEXES_AFTER)
+        # dropped/cleared above: every document is new, so plain inserts instead of upserts
+        fresh = DROP_COLLECTION or CLEAR_COLLECTION
 
         courts = sorted([d for d in root.iterdir() if d.is_dir()])
         for court_dir in courts:
@@ -182,11 +485,21 @@ def ingest():
                 continue
 
             # group rows by year
-            by_year: Dict[str, List[Dict[str, str]]] = {}
+            by_year: Dict[str, List[CsvRow]] = {}
             for r in rows:
-                by_year.setdefault(r["year"], []).append(r)
-
-            matched = unmatched = 0
+                by_year.setdefault(r.year, []).append(r)
+
+            matched = unmatched = unchanged = 0
+            ops: List[UpdateOne] = []
+            blob_ops: List[UpdateOne] = []
+            # fresh load: doc_id -> document, a later CSV row for the same doc_id replacing
+            # the earlier one (as its upsert would); inserted once the court's blobs are written
+            docs: Dict[int, Dict[str, Any]] = {}
+            # blob ids already stored for this court: unchanged files skip the content write
+            stored = {} if fresh else {
+                d.get("doc_id"): d.get("content_blob")
+                for d in col.find({"category_name": category_name},
+                                  {"_id": 0, "doc_id": 1, "content_blob": 1})}
 
             for year_str, year_rows in sorted(by_year.items()):
                 year_dir = court_dir / year_str
@@ -197,56 +510,89 @@ def ingest():
 
                 idx = build_year_index(year_dir)
 
+                tasks = []
                 for row in year_rows:
-                    key = norm_key(row["title"])
+                    key = norm_key(row.title)
                     p = idx.get(key)
                     if not p:
                         unmatched += 1
                         continue
 
-                    html, enc = read_text_file(p)
-                    if not html:
-                        unmatched += 1
-                        continue
-
-                    html_bytes = len(html.encode("utf-8", errors="replace"))
-                    if html_bytes > MAX_HTML_BYTES:
-                        print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
-                        unmatched += 1
-                        continue
-
                     try:
-                        doc_id_int = int(row["doc_id"])
+                        doc_id_int = int(row.doc_id)
                         year_int = int(year_str)
                     except Exception:
                         unmatched += 1
                         continue
+                    tasks.append((p, row, doc_id_int, year_int))
+
+                loaded = load_htmls([(t[0], stored.get(t[2])) for t in tasks], io_pool, wc_pool)
+                for (p, row, doc_id_int, year_int), (html, html_bytes, digest, wc) in zip(tasks, loaded):
+                    if not html and digest is None:
+                        if html_bytes > MAX_HTML_BYTES:
+                            print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
+                        unmatched += 1
+                        continue
 
                     # ---- store in requested shape ----
                     document_to_insert = {
                         "doc_id": doc_id_int,
-                        "full_title": row["title"],
+                        "full_title": row.title,
                         "category": "district_court",      # constant
                         "category_name": category_name,     # court folder name
                         "year": year_int,
                         "law_type": "judgments",            # << updated here
-                        "word_count": word_count_from_html(html),
-                        "content": html,
                     }
-
-                    # upsert on (category_name, doc_id)
-                    col.update_one(
-                        {"category_name": category_name, "doc_id": doc_id_int},
-                        {"$set": document_to_insert},
-                        upsert=True
-                    )
-                    matched += 1
-
-            print(f"✅ {category_name}: matched={matched}, unmatched={unmatched}")
+                    update = {"$set": document_to_insert}
+                    if html:
+                        # HTML goes to the blob collection once per distinct content
+                        blob_ops.append(UpdateOne({"_id": digest}, {"$setOnInsert": {"content": html}}, upsert=True))
+                        document_to_insert.update(word_count=wc, content_blob=digest)
+                        update["$unset"] = {"content": "", "content_hash": ""}  # older inline shape
+                    else:
+                        unchanged += 1  # same content as stored: metadata only
+
+                    if fresh:
+                        if doc_id_int not in docs:
+                            matched += 1
+                        docs[doc_id_int] = document_to_insert
+                    else:
+                        # upsert on (category_name, doc_id), sent in batches
+                        ops.append(UpdateOne(
+                            {"category_name": category_name, "doc_id": doc_id_int},
+                            update,
+                            upsert=True
+                        ))
+                        matched += 1
+                    if max(len(ops), len(blob_ops)) >= BULK_SIZE:
+                        inflight.append(pool.submit(flush_upserts, col, ops, blob_col, blob_ops))
+                        ops, blob_ops = [], []
+                        failed = drain(MAX_INFLIGHT - 1)
+                        matched -= failed
+                        unmatched += failed
+
+            inflight.append(pool.submit(flush_upserts, col, ops, blob_col, blob_ops))
+            failed = drain(0)
+            docs_list = list(docs.values())
+            for i in range(0, len(docs_list), BULK_SIZE):
+                inflight.append(pool.submit(flush_inserts, col, docs_list[i:i + BULK_SIZE]))
+                failed += drain(MAX_INFLIGHT - 1)
+            failed += drain(0)
+            matched -= failed
+            unmatched += failed
+            print(f"✅ {category_name}: matched={matched} (content unchanged={unchanged}), unmatched={unmatched}")
 
         total = col.count_documents({})
         print({"total_docs_in_collection": total})
     finally:
+        if BUILD_INDEXES_AFTER:
+            try:
+                ensure_indexes(col)
+            except Exception as e:
+                print(f"❌ Error creating indexes: {e}")
+        io_pool.shutdown(wait=True)
+        wc_pool.shutdown(wait=True)
+        pool.shutdown(wait=True)
         client.close()
         print("✅ MongoDB connection closed.")
 
@@ -18,11 +18,26 @@ Mongo:
 - Coll: high_courts
 """
 
+import codecs
+import hashlib
+import io
+import mmap
+import multiprocessing
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+
+# libxml2 text extraction for word counts when available; regex stripping otherwise
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
 
 # ===== CONFIG =====
 MONGO_URI = "mongodb://localhost:27017/"
@@ -30,38 +45,121 @@ DB_NAME   = "legal_dashboard_db"
 COLL_NAME = "high_courts"
 
 HTML_DIR  = "/DATACHAI/Data/sample_high_court_html/processed_html"
-FALLBACK_ENCODINGS = ["utf-8", "utf-8-sig", "cp1252", "latin-1"]
+DEFAULT_ENCODING = "utf-8"  # files without a byte-order mark
+MMAP_MIN_BYTES = 64 * 1024  # larger files are decoded straight from a read-only mmap
+READ_WORKERS   = os.cpu_count() or 1  # processes reading + word-counting HTML
+READ_CHUNKSIZE = 32                   # files per worker task
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and its monitor threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+BULK_SIZE      = 500                  # documents per insert_many / bulk_write
+# build the secondary indexes once after the load instead of maintaining them per write
+BUILD_INDEXES_AFTER = os.getenv("HC_BUILD_INDEXES_AFTER", "1").lower() in ("1", "true", "yes")
 # ==================
 
+# script/style elements with their bodies, else any single tag: one scan instead of three
+MARKUP_PATTERN = re.compile(r"(?is)<script[^>]*>.*?</script>|<style[^>]*>.*?</style>|<[^>]+>")
+WORD_PATTERN   = re.compile(r"\b\w+\b")
+YEAR_PATTERN   = re.compile(r"(\d{4})-\d{2}-\d{2}$")  # ...YYYY-MM-DD at end of the stem
+
 
 # ---------- helpers ----------
+def sniff_encoding(head: bytes) -> str:
+    """Encoding named by a byte-order mark; DEFAULT_ENCODING (decoded with errors="replace") otherwise."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return DEFAULT_ENCODING
+
 def read_text_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
-    for enc in FALLBACK_ENCODINGS:
-        try:
-            return p.read_text(encoding=enc, errors="replace"), enc
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return None, None
-
-def html_to_text(html: str) -> str:
-    # strip script/style, tags, and compress whitespace
-    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
-    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
-    text = re.sub(r"(?s)<[^>]+>", " ", html)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    """
+    Read once, decoding with the encoding sniffed from the BOM. Files of MMAP_MIN_BYTES or
+    more are decoded straight from a read-only mmap (no intermediate bytes copy), with
+    newlines translated as text mode does.
+    """
+    try:
+        with open(p, "rb") as raw:
+            if os.fstat(raw.fileno()).st_size < MMAP_MIN_BYTES:
+                enc = sniff_encoding(raw.peek(4)[:4])
+                with io.TextIOWrapper(raw, encoding=enc, errors="replace") as f:
+                    return f.read(), enc
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                enc = sniff_encoding(mm[:4])
+                text = str(mm, enc, "replace")
+    except Exception:
+        return None, None
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, enc
+
+def count_words(text: str) -> int:
+    """Number of WORD_PATTERN matches, counted without building the list of words."""
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
 
 def word_count_from_html(html: str) -> int:
-    return len(re.findall(r"\b\w+\b", html_to_text(html)))
+    if etree is not None and html:
+        try:
+            try:
+                root = etree.fromstring(html, LXML_PARSER)
+            except ValueError:
+                # str content with an <?xml encoding=...?> declaration: lxml wants bytes
+                root = etree.fromstring(html.encode("utf-8", errors="replace"), LXML_PARSER)
+        except (etree.ParserError, ValueError):
+            root = None
+        if root is not None:
+            etree.strip_elements(root, "script", "style", with_tail=False)
+            # element text only (comments and processing instructions are not words), counted
+            # per text node as it is walked: no joined copy of the document text
+            return sum(map(count_words, root.itertext(etree.Element)))
+    # whitespace collapsing does not change the count: skip it
+    return count_words(MARKUP_PATTERN.sub(" ", html))
+
+def content_hash(html: str) -> str:
+    """128-bit BLAKE2 digest of the HTML, stored as content_hash."""
+    return hashlib.blake2b(html.encode("utf-8", errors="replace"), digest_size=16).hexdigest()
+
+def load_html(task: Tuple[str, Optional[str]]) -> Tuple[Optional[str], int, Optional[str]]:
+    """
+    Worker: read one (path, stored hash) -> (html, word count, content hash).
+    html is None if the file is unreadable (hash None too) or matches the stored hash.
+    """
+    p, stored_hash = task
+    html, _ = read_text_file(p)
+    if not html:
+        return None, 0, None
+    digest = content_hash(html)
+    if digest == stored_hash:
+        return None, 0, digest
+    return html, word_count_from_html(html), digest
+
+def map_bounded(ex, fn, items: list, window: int):
+    """ex.map over items `window` at a time, so only one window of results is held in memory."""
+    for i in range(0, len(items), window):
+        yield from ex.map(fn, items[i:i + window], chunksize=READ_CHUNKSIZE)
+
+def list_html_files(root: str) -> List[Tuple[str, str]]:
+    """
+    One scandir pass over root -> [(path, stem)], *.html first then *.htm, matching
+    the two Path.glob calls it replaces (suffix match case-sensitive).
+    """
+    html, htm = [], []
+    with os.scandir(root) as it:
+        for e in it:
+            name = e.name
+            if name.endswith(".html"):
+                html.append((e.path, os.path.splitext(name)[0]))
+            elif name.endswith(".htm"):
+                htm.append((e.path, os.path.splitext(name)[0]))
+    return html + htm
 
 def parse_year_from_stem(stem: str) -> Optional[int]:
     """
     Try to find a YYYY-MM-DD at end of the stem and return YYYY as int.
     Example: HPHC010000012001_1_2011-06-22 -> 2011
     """
-    m = re.search(r"(\d{4})-\d{2}-\d{2}$", stem)
+    m = YEAR_PATTERN.search(stem)
     if not m:
         return None
     try:
@@ -71,17 +169,65 @@ def parse_year_from_stem(stem: str) -> Optional[int]:
 # ------------------------------
 
 
-def ensure_indexes(col):
-    # Unique doc_id since we upsert by it (string key)
+def ensure_indexes(col, secondary: bool = True):
+    # Unique doc_id since we upsert by it (string key); always in place before writing
     col.create_index([("doc_id", ASCENDING)], unique=True, name="doc_id_unique")
+    if not secondary:
+        return
     # Useful filter
     col.create_index([("year", ASCENDING)], name="year_idx")
     col.create_index([("category", ASCENDING)], name="category_idx")
     col.create_index([("law_type", ASCENDING)], name="law_type_idx")
 
 
+def flush_inserts(col, docs: List[Dict[str, Any]]) -> int:
+    """
+    insert_many a batch of documents expected to be new (no per-doc lookup on the server).
+    Docs that hit the unique doc_id index are upserted instead. Returns the number of failed docs.
+    """
+    if not docs:
+        return 0
+    try:
+        col.insert_many(docs, ordered=False, bypass_document_validation=True)
+        return 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+    # insert_many set an _id on every doc; the upsert must not try to change the stored one
+    dup_ops = [
+        UpdateOne({"doc_id": docs[err["index"]]["doc_id"]},
+                  {"$set": {k: v for k, v in docs[err["index"]].items() if k != "_id"}},
+                  upsert=True)
+        for err in errors if err.get("code") == 11000
+    ]
+    failed = len(errors) - len(dup_ops)
+    if failed:
+        print(f"   ⚠️ insert_many: {failed} failed, e.g. {[err for err in errors if err.get('code') != 11000][:3]} …")
+    if dup_ops:
+        try:
+            col.bulk_write(dup_ops, ordered=False, bypass_document_validation=True)
+        except BulkWriteError as e:
+            upsert_errors = e.details.get("writeErrors", [])
+            print(f"   ⚠️ BulkWriteError: {len(upsert_errors)} failed, e.g. {upsert_errors[:3]} …")
+            failed += len(upsert_errors)
+    return failed
+
+
+def flush_upserts(col, ops: List[UpdateOne]) -> int:
+    """Send a batch of upserts in one unordered bulk_write; returns the number of failed ops."""
+    if not ops:
+        return 0
+    try:
+        col.bulk_write(ops, ordered=False, bypass_document_validation=True)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        print(f"   ⚠️ BulkWriteError: {len(errors)} failed, e.g. {errors[:3]} …")
+        return len(errors)
+    return 0
+
+
 def connect_collection():
-    client = MongoClient(MONGO_URI)
+    # bulk load: primary ack without journal wait, compressed wire (HTML compresses well)
+    client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib")
     db = client[DB_NAME]
     db.command("ping")
     return client, db[COLL_NAME]
@@ -95,49 +241,79 @@ def ingest_high_courts():
 
     client, col = connect_collection()
     try:
-        ensure_indexes(col)
+        ensure_indexes(col, secondary=not BUILD_INDEXES_AFTER)
 
         matched = 0
         skipped = 0
 
-        files = list(root.glob("*.html")) + list(root.glob("*.htm"))
+        files = list_html_files(HTML_DIR)
         if not files:
             print(f"⚠️  No .html/.htm files under: {root}")
             return
 
-        for path in files:
-            stem = path.stem  # e.g. "HPHC010000012001_1_2011-06-22"
-            html, enc = read_text_file(path)
-            if not html:
-                skipped += 1
-                continue
-
-            wc = word_count_from_html(html)
-            yr = parse_year_from_stem(stem)
-
-            document_to_insert = {
-                "doc_id": stem,                # string doc_id (filename stem)
-                "full_title": stem,            # as requested
-                "title": stem,                 # same as full_title for now
-                "category": "high_court",      # as requested
-                "law_type": "judgment",        # as requested
-                "year": yr,                    # None if not parsed
-                "word_count": wc,
-                "content": html
-            }
-
-            col.update_one(
-                {"doc_id": stem},
-                {"$set": document_to_insert},
-                upsert=True
-            )
-            matched += 1
+        # content hashes already stored: unchanged files skip the content write
+        stored = {d.get("doc_id"): d.get("content_hash")
+                  for d in col.find({}, {"_id": 0, "doc_id": 1, "content_hash": 1})}
+        unchanged = 0
+        inserts: List[Dict[str, Any]] = []  # doc_ids not stored yet
+        ops: List[UpdateOne] = []           # doc_ids already stored
+
+        # file reads and word counts are CPU-bound: run them in worker processes
+        with ProcessPoolExecutor(max_workers=READ_WORKERS, mp_context=MP_CONTEXT) as readers:
+            tasks = [(path, stored.get(stem)) for path, stem in files]
+            loaded = map_bounded(readers, load_html, tasks, READ_WORKERS * READ_CHUNKSIZE * 2)
+            for (_, stem), (html, wc, digest) in zip(files, loaded):
+                # stem e.g. "HPHC010000012001_1_2011-06-22"
+                if not html and digest is None:
+                    skipped += 1
+                    continue
+
+                yr = parse_year_from_stem(stem)
+
+                document_to_insert = {
+                    "doc_id": stem,                # string doc_id (filename stem)
+                    "full_title": stem,            # as requested
+                    "title": stem,                 # same as full_title for now
+                    "category": "high_court",      # as requested
+                    "law_type": "judgment",        # as requested
+                    "year": yr,                    # None if not parsed
+                }
+                if html:
+                    document_to_insert.update(word_count=wc, content=html, content_hash=digest)
+                else:
+                    unchanged += 1  # same content as stored: metadata only
+
+                matched += 1
+                if stem in stored:
+                    ops.append(UpdateOne({"doc_id": stem}, {"$set": document_to_insert}, upsert=True))
+                    if len(ops) >= BULK_SIZE:
+                        failed = flush_upserts(col, ops)
+                        matched -= failed
+                        skipped += failed
+                        ops = []
+                else:
+                    # new doc_id: a plain insert needs no lookup on the server
+                    inserts.append(document_to_insert)
+                    if len(inserts) >= BULK_SIZE:
+                        failed = flush_inserts(col, inserts)
+                        matched -= failed
+                        skipped += failed
+                        inserts = []
+
+        failed = flush_inserts(col, inserts) + flush_upserts(col, ops)
+        matched -= failed
+        skipped += failed
 
         total = col.estimated_document_count()
-        print(f"✅ High Court ingest: upserted {matched}, skipped {skipped}.")
+        print(f"✅ High Court ingest: upserted {matched} (content unchanged {unchanged}), skipped {skipped}.")
         print({"total_docs_in_high_courts": total})
 
     finally:
+        if BUILD_INDEXES_AFTER:
+            try:
+                ensure_indexes(col)
+            except Exception as e:
+                print(f"❌ Error creating indexes: {e}")
         client.close()
         print("🔌 MongoDB connection closed.")
 
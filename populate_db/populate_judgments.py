@@ -21,13 +21,35 @@ MongoDB (legal_dashboard_db.judgments) document:
 """
 
 import os
+import io
+import mmap
+import multiprocessing
+import codecs
 import re
 import csv
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, Dict, Any, List
+from operator import itemgetter
+from typing import Optional, Tuple, Dict, Any, List, NamedTuple, Set
 from html import unescape
 
-from pymongo import MongoClient, ASCENDING
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+
+# libxml2 text extraction for word counts when available; regex stripping otherwise
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
+
+# C CSV parser for the download logs when pandas is installed; csv module otherwise
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
 
 # ===== CONFIG =====
 CSV_PATH   = "/DATACHAI/Data/Judments/Supreme_Court/supreme_court_logs_enriched.csv"
@@ -39,57 +61,230 @@ COLL_NAME  = "judgments"
 
 DROP_COLLECTION  = True    # drop collection & indexes, rebuild from scratch
 CLEAR_COLLECTION = False   # alternative: clear docs, keep indexes
+# incremental load (neither of the above): doc_ids already stored are skipped unless set
+FORCE_REINGEST = os.getenv("FORCE_REINGEST", "0").lower() in ("1", "true", "yes")
 
 MAX_HTML_BYTES = 15_000_000
-FALLBACK_ENCODINGS = ["utf-8-sig", "utf-8", "cp1252", "latin-1"]
+DEFAULT_ENCODING = "utf-8-sig"  # files without a byte-order mark
+MMAP_MIN_BYTES = 64 * 1024  # larger files are decoded straight from a read-only mmap
 CATEGORY_NAME = "Supreme_Court"
+INSERT_BATCH = 500          # documents per insert_many
+READ_WORKERS   = os.cpu_count() or 1  # processes reading + word-counting HTML
+READ_CHUNKSIZE = 32                   # files per worker task
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and its monitor threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
 # ==================
 
+# script/style elements with their bodies, else any single tag: one scan instead of three
+MARKUP_PATTERN = re.compile(r"(?is)<script[^>]*>.*?</script>|<style[^>]*>.*?</style>|<[^>]+>")
+WORD_PATTERN   = re.compile(r"\b\w+\b")
 
-def read_text_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
-    for enc in FALLBACK_ENCODINGS:
-        try:
-            return p.read_text(encoding=enc, errors="replace"), enc
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return None, None
+CSV_COLUMNS = {                      # row field -> CSV header aliases, first non-empty wins
+    "year":   ("year", "Year"),
+    "doc_id": ("doc_id", "Doc_id", "id"),
+    "title":  ("title", "Title", "full_title"),
+}
+CSV_HEADERS = {h for aliases in CSV_COLUMNS.values() for h in aliases}
 
 
-def html_to_text(html: str) -> str:
-    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
-    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
-    html = re.sub(r"(?s)<[^>]+>", " ", html)
-    txt = unescape(html)
-    txt = re.sub(r"\s+", " ", txt).strip()
-    return txt
+class CsvRow(NamedTuple):
+    """One usable CSV row (fields in CSV_COLUMNS order)."""
+    year: str
+    doc_id: str
+    title: str
 
 
+def sniff_encoding(head: bytes) -> str:
+    """Encoding named by a byte-order mark; DEFAULT_ENCODING (decoded with errors="replace") otherwise."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return DEFAULT_ENCODING
 
-def word_count_from_html(html: str) -> int:
-    return len(re.findall(r"\b\w+\b", html_to_text(html)))
 
-def load_csv_rows(csv_path: Path) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    for enc in FALLBACK_ENCODINGS:
+def read_text_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Read once, decoding with the encoding sniffed from the BOM. Files of MMAP_MIN_BYTES or
+    more are decoded straight from a read-only mmap (no intermediate bytes copy), with
+    newlines translated as text mode does.
+    """
+    try:
+        with open(p, "rb") as raw:
+            if os.fstat(raw.fileno()).st_size < MMAP_MIN_BYTES:
+                enc = sniff_encoding(raw.peek(4)[:4])
+                with io.TextIOWrapper(raw, encoding=enc, errors="replace") as f:
+                    return f.read(), enc
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                enc = sniff_encoding(mm[:4])
+                text = str(mm, enc, "replace")
+    except Exception:
+        return None, None
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, enc
+
+
+def count_words(text: str) -> int:
+    """Number of WORD_PATTERN matches, counted without building the list of words."""
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
+
+
+def word_count_from_html(html: str) -> int:
+    if etree is not None and html:
+        try:
+            try:
+                root = etree.fromstring(html, LXML_PARSER)
+            except ValueError:
+                # str content with an <?xml encoding=...?> declaration: lxml wants bytes
+                root = etree.fromstring(html.encode("utf-8", errors="replace"), LXML_PARSER)
+        except (etree.ParserError, ValueError):
+            root = None
+        if root is not None:
+            etree.strip_elements(root, "script", "style", with_tail=False)
+            # element text only (comments and processing instructions are not words), counted
+            # per text node as it is walked: no joined copy of the document text
+            return sum(map(count_words, root.itertext(etree.Element)))
+    # whitespace collapsing does not change the count: skip it
+    return count_words(unescape(MARKUP_PATTERN.sub(" ", html)))
+
+def list_year_htmls(year_dir: Path) -> Optional[Dict[str, str]]:
+    """
+    <doc_id> -> path of <doc_id>.html (preferred) or <doc_id>.htm directly in year_dir, from a
+    single os.scandir listing; None if the folder is missing or unreadable.
+    """
+    by_stem: Dict[str, str] = {}
+    try:
+        with os.scandir(year_dir) as it:
+            for e in it:
+                name = e.name
+                if name.endswith(".html"):
+                    stem = name[:-5]
+                elif name.endswith(".htm"):
+                    stem = name[:-4]
+                    if stem in by_stem:
+                        continue
+                else:
+                    continue
+                if e.is_file():
+                    by_stem[stem] = e.path
+    except OSError:
+        return None
+    return by_stem
+
+
+def utf8_size(s: str) -> int:
+    """
+    UTF-8 size of s for the MAX_HTML_BYTES check, without encoding s when its code point count
+    decides: exact for ASCII (an O(1) flag), a lower bound once over the cap (>= 1 byte per
+    code point), an upper bound when even 4 bytes per code point stays within it.
+    """
+    n = len(s)
+    if s.isascii() or n > MAX_HTML_BYTES:
+        return n
+    if n * 4 <= MAX_HTML_BYTES:
+        return n * 4
+    return len(s.encode("utf-8", errors="replace"))
+
+
+def load_html(p: str) -> Tuple[Optional[str], int, int]:
+    """
+    Worker: read one HTML file -> (html, size in bytes, word count).
+    html is None if the file is unreadable or larger than MAX_HTML_BYTES.
+    """
+    try:
+        html_bytes = os.stat(p).st_size
+    except OSError:
+        return None, 0, 0
+    if html_bytes > MAX_HTML_BYTES:
+        return None, html_bytes, 0  # too big on disk: not read at all
+    html, _ = read_text_file(p)
+    if not html:
+        return None, 0, 0
+    # decoded UTF-8 is at most 3 bytes per raw byte: only re-measure when that could pass the cap
+    if html_bytes * 3 > MAX_HTML_BYTES:
+        html_bytes = utf8_size(html)
+        if html_bytes > MAX_HTML_BYTES:
+            return None, html_bytes, 0
+    return html, html_bytes, word_count_from_html(html)
+
+
+def load_document(task: Tuple[Any, Dict[str, Any]]) -> Tuple[Optional[bytes], int]:
+    """
+    Worker: (path, document without content) -> (BSON of the full document, size in bytes).
+    BSON is None if the file is unreadable or too big. Encoding the multi-MB content here
+    keeps it off the main process, which hands it to the driver as a RawBSONDocument.
+    """
+    p, document = task
+    html, html_bytes, wc = load_html(p)
+    if not html:
+        return None, html_bytes
+    document.update(word_count=wc, content=html)
+    return bson.encode(document), html_bytes
+
+
+def map_bounded(ex, fn, items: list, window: int):
+    """ex.map over items `window` at a time, so only one window of results is held in memory."""
+    for i in range(0, len(items), window):
+        yield from ex.map(fn, items[i:i + window], chunksize=READ_CHUNKSIZE)
+
+
+def load_csv_rows_pandas(csv_path: Path, enc: str) -> List[CsvRow]:
+    """load_csv_rows on pandas' C parser: alias resolution and filtering run column-wise."""
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, usecols=lambda c: c in CSV_HEADERS,
+                     encoding=enc, encoding_errors="replace")
+    out = pd.DataFrame(index=df.index)
+    for field, aliases in CSV_COLUMNS.items():
+        col = pd.Series("", index=df.index, dtype=object)
+        for h in reversed(aliases):
+            if h in df.columns:
+                v = df[h].fillna("")
+                col = v.where(v != "", col)
+        out[field] = col.astype(str).str.strip()
+    out = out[(out["year"] != "") & (out["doc_id"] != "") & (out["title"] != "")]
+    return list(map(CsvRow._make, out.itertuples(index=False, name=None)))
+
+
+def load_csv_rows(csv_path: Path) -> List[CsvRow]:
+    with open(csv_path, "rb") as f:
+        enc = sniff_encoding(f.read(4))
+    if pd is not None:
         try:
-            with open(csv_path, newline="", encoding=enc, errors="replace") as f:
-                reader = csv.DictReader(f)
-                for r in reader:
-                    rows.append({
-                        "year":   (r.get("year")   or r.get("Year")   or "").strip(),
-                        "doc_id": (r.get("doc_id") or r.get("Doc_id") or r.get("id") or "").strip(),
-                        "title":  (r.get("title")  or r.get("Title")  or r.get("full_title") or "").strip(),
-                    })
-            break
-        except UnicodeDecodeError:
-            continue
-    return [r for r in rows if r["year"] and r["doc_id"] and r["title"]]
+            return load_csv_rows_pandas(csv_path, enc)
+        except Exception as e:
+            print(f"   ⚠️ pandas could not parse {csv_path.name} ({e}), using csv module")
+    rows: List[CsvRow] = []
+    with open(csv_path, newline="", encoding=enc, errors="replace") as f:
+        reader = csv.reader(f)
+        pos = {h: i for i, h in enumerate(next(reader, []))}  # repeated header: last column, as DictReader
+        cols = [[pos[h] for h in aliases if h in pos] for aliases in CSV_COLUMNS.values()]
+        if not all(cols):
+            return rows
+        if all(len(c) == 1 for c in cols):
+            # one header per field (the usual log file): plain positional picks
+            get = itemgetter(*(c[0] for c in cols))
+            width = max(c[0] for c in cols) + 1
+            for r in reader:
+                if len(r) >= width:
+                    year, doc_id, title = get(r)
+                    row = CsvRow(year.strip(), doc_id.strip(), title.strip())
+                    if row.year and row.doc_id and row.title:
+                        rows.append(row)
+            return rows
+        for r in reader:
+            n = len(r)
+            # first non-empty alias per field
+            row = CsvRow(*(next((r[i] for i in c if i < n and r[i]), "").strip() for c in cols))
+            if row.year and row.doc_id and row.title:
+                rows.append(row)
+    return rows
 
 
 def connect_collection():
-    client = MongoClient(MONGO_URI)
+    # bulk load: primary ack without journal wait, compressed wire (HTML compresses well)
+    client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib")
     db = client[DB_NAME]
     col = db[COLL_NAME]
     client.admin.command("ping")
@@ -114,6 +309,38 @@ def ensure_indexes(col):
     col.create_index([("year", ASCENDING)], name="year_idx")
 
 
+def flush_inserts(col, docs: List[Dict[str, Any]]) -> int:
+    """
+    insert_many a batch of documents expected to be new (no per-doc lookup on the server).
+    Docs that hit the unique doc_id index are upserted instead. Returns the number of failed docs.
+    """
+    if not docs:
+        return 0
+    try:
+        col.insert_many(docs, ordered=False, bypass_document_validation=True)
+        return 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+    # insert_many set an _id on every (dict) doc; the upsert must not try to change the stored one
+    dup_ops = [
+        UpdateOne({"doc_id": docs[err["index"]]["doc_id"]},
+                  {"$set": {k: v for k, v in docs[err["index"]].items() if k != "_id"}},
+                  upsert=True)
+        for err in errors if err.get("code") == 11000
+    ]
+    failed = len(errors) - len(dup_ops)
+    if failed:
+        print(f"   ⚠️ insert_many: {failed} failed, e.g. {[err for err in errors if err.get('code') != 11000][:3]} …")
+    if dup_ops:
+        try:
+            col.bulk_write(dup_ops, ordered=False, bypass_document_validation=True)
+        except BulkWriteError as e:
+            upsert_errors = e.details.get("writeErrors", [])
+            print(f"   ⚠️ BulkWriteError: {len(upsert_errors)} failed, e.g. {upsert_errors[:3]} …")
+            failed += len(upsert_errors)
+    return failed
+
+
 def ingest():
     csv_path = Path(CSV_PATH).resolve()
     if not csv_path.exists():
@@ -127,69 +354,101 @@ def ingest():
     client, col = connect_collection()
     try:
         drop_or_clear(col)
-        ensure_indexes(col)
+        if not DROP_COLLECTION:
+            ensure_indexes(col)  # incremental load: upserts rely on doc_id_unique
 
         rows = load_csv_rows(csv_path)
         if not rows:
             print("⚠️  CSV empty or missing required headers (year, doc_id, title).")
             return
 
-        matched = unmatched = 0
-
-        for row in rows:
+        # without doc_id_unique during a fresh load, repeated CSV doc_ids must be dropped here:
+        # keep the last row for each (the one an upsert would have left in place)
+        last_row: Dict[int, int] = {}
+        for i, row in enumerate(rows):
+            if row.doc_id.isdecimal():
+                last_row[int(row.doc_id)] = i
+
+        # incremental load: stored doc_ids, fetched once, are never read from disk again
+        existing: Set[int] = set()
+        if not (DROP_COLLECTION or CLEAR_COLLECTION or FORCE_REINGEST):
+            cur = col.find({}, {"_id": 0, "doc_id": 1}).batch_size(10_000)
+            existing = {d["doc_id"] for d in cur}
+
+        matched = unmatched = skipped_existing = 0
+        batch: List[Dict[str, Any]] = []
+        tasks: List[Tuple[str, Dict[str, Any]]] = []  # (path, document without content)
+        year_files: Dict[int, Optional[Dict[str, str]]] = {}  # year -> list_year_htmls, on first use
+
+        for i, row in enumerate(rows):
             try:
-                year_int = int(row["year"])
-                doc_id_int = int(row["doc_id"])
+                year_int = int(row.year)
+                doc_id_int = int(row.doc_id)
             except Exception:
                 unmatched += 1
                 continue
-
-            year_dir = root / str(year_int)
-            if not (year_dir.exists() and year_dir.is_dir()):
-                unmatched += 1
+            if last_row.get(doc_id_int, i) != i:
                 continue
-
-            # Look for <doc_id>.html or <doc_id>.htm
-            p_html = year_dir / f"{doc_id_int}.html"
-            p_htm  = year_dir / f"{doc_id_int}.htm"
-            p = p_html if p_html.exists() else (p_htm if p_htm.exists() else None)
-            if not p:
-                unmatched += 1
+            if doc_id_int in existing:
+                skipped_existing += 1
                 continue
 
-            html, enc = read_text_file(p)
-            if not html:
+            # one directory listing per year instead of stat calls per row
+            if year_int not in year_files:
+                year_files[year_int] = list_year_htmls(root / str(year_int))
+            files = year_files[year_int]
+            if files is None:
                 unmatched += 1
                 continue
 
-            html_bytes = len(html.encode("utf-8", errors="replace"))
-            if html_bytes > MAX_HTML_BYTES:
-                print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
+            # Look for <doc_id>.html or <doc_id>.htm
+            p = files.get(str(doc_id_int))
+            if not p:
                 unmatched += 1
                 continue
 
-            document_to_insert = {
+            tasks.append((p, {
                 "doc_id": doc_id_int,
-                "full_title": row["title"],
+                "full_title": row.title,
                 "category": "judgments",
                 "category_name": CATEGORY_NAME,
                 "year": year_int,
                 "law_type": "judgment",
-                "word_count": word_count_from_html(html),
-                "content": html
-            }
-
-            col.update_one(
-                {"doc_id": document_to_insert["doc_id"]},
-                {"$set": document_to_insert},
-                upsert=True
-            )
-            matched += 1
-
-        print(f"✅ {CATEGORY_NAME}: matched={matched}, unmatched={unmatched}")
+            }))
+
+        # file reads, word counts and BSON encoding are CPU-bound: run them in worker processes
+        with ProcessPoolExecutor(max_workers=READ_WORKERS, mp_context=MP_CONTEXT) as readers:
+            loaded = map_bounded(readers, load_document, tasks, READ_WORKERS * READ_CHUNKSIZE * 2)
+            for (p, _), (raw, html_bytes) in zip(tasks, loaded):
+                if raw is None:
+                    if html_bytes > MAX_HTML_BYTES:
+                        print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
+                    unmatched += 1
+                    continue
+
+                # every document is normally new (fresh load): plain inserts, upsert on conflict;
+                # no _id in the raw document, the server assigns it
+                batch.append(RawBSONDocument(raw))
+                matched += 1
+                if len(batch) >= INSERT_BATCH:
+                    failed = flush_inserts(col, batch)
+                    matched -= failed
+                    unmatched += failed
+                    batch = []
+
+        failed = flush_inserts(col, batch)
+        matched -= failed
+        unmatched += failed
+        print(f"✅ {CATEGORY_NAME}: matched={matched}, unmatched={unmatched}, skipped_existing={skipped_existing}")
         total = col.count_documents({})
         print({"total_docs_in_collection": total})
     finally:
+        if DROP_COLLECTION:
+            # fresh collection: one sorted index build instead of per-insert B-tree updates
+            try:
+                ensure_indexes(col)
+            except Exception as e:
+                print(f"❌ Error creating indexes: {e}")
         client.close()
         print("✅ MongoDB connection closed.")
 
@@ -12,14 +12,37 @@ Default is INSERT-ONLY (won't touch existing doc_ids). Use --update-existing to
 """
 
 import os
+import io
+import mmap
+import multiprocessing
+import codecs
 import re
 import csv
 import argparse
 from pathlib import Path
-from typing import Optional, Tuple, Dict, Any, List, Set
+from operator import itemgetter
+from typing import Optional, Tuple, Dict, Any, List, Set, NamedTuple
 from html import unescape
-
-from pymongo import MongoClient, ASCENDING
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+
+# libxml2 text extraction for word counts when available; regex stripping otherwise
+try:
+    from lxml import etree
+    LXML_PARSER = etree.HTMLParser(recover=True)
+except ImportError:
+    etree = None
+
+# C CSV parser for the download logs when pandas is installed; csv module otherwise
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
 
 # ===== CONFIG (can be overridden by env or CLI) =====
 DOC_ROOT   = "/DATACHAI/Data/Judments/Tribunals"
@@ -28,42 +51,177 @@ DB_NAME    = "legal_dashboard_db"
 COLL_NAME  = "tribunals"
 
 MAX_HTML_BYTES = 15_000_000
-FALLBACK_ENCODINGS = ["utf-8-sig", "utf-8", "cp1252", "latin-1"]
+DEFAULT_ENCODING = "utf-8-sig"  # files without a byte-order mark
+MMAP_MIN_BYTES = 64 * 1024  # larger files are decoded straight from a read-only mmap
+BULK_SIZE      = 1000                 # upserts per bulk_write
+BULK_BYTES     = 48 * 1024 * 1024     # ...or fewer once their documents reach this many BSON bytes
+SCAN_WORKERS   = 8                    # threads scanning year folders
+READ_WORKERS   = os.cpu_count() or 1  # processes reading + word-counting HTML
+READ_CHUNKSIZE = 32                   # files per worker task
+# Workers start from a forkserver (spawn where there is none), never fork() of this
+# process: by the first submit it holds the MongoClient and its monitor threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+# "approx": estimate word_count from the HTML length instead of parsing it (see approx_word_count)
+WORD_COUNT_MODE = os.getenv("WORD_COUNT_MODE", "exact").lower()
+# build the secondary indexes once after the load instead of maintaining them per write
+BUILD_INDEXES_AFTER = os.getenv("TRIB_BUILD_INDEXES_AFTER", "1").lower() in ("1", "true", "yes")
 # ====================================================
 
+CSV_COLUMNS = {                      # row field -> CSV header aliases, first non-empty wins
+    "year":   ("year", "Year"),
+    "doc_id": ("doc_id", "Doc_id", "id"),
+    "title":  ("title", "Title"),
+}
+CSV_HEADERS = {h for aliases in CSV_COLUMNS.values() for h in aliases}
+
+
+class CsvRow(NamedTuple):
+    """One usable CSV row (fields in CSV_COLUMNS order)."""
+    year: str
+    doc_id: str
+    title: str
 
-def read_text_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
-    for enc in FALLBACK_ENCODINGS:
-        try:
-            return p.read_text(encoding=enc, errors="replace"), enc
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return None, None
 
+DOC_ID_PATTERN    = re.compile(r"\d+")
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9 ]+")
+# script/style elements with their bodies, else any single tag: one scan instead of three
+MARKUP_PATTERN    = re.compile(r"(?is)<script[^>]*>.*?</script>|<style[^>]*>.*?</style>|<[^>]+>")
+WORD_PATTERN      = re.compile(r"\b\w+\b")
+# norm_key's NON_ALNUM_PATTERN as a str.translate table, for ASCII input
+ASCII_NON_ALNUM_TABLE = {c: " " for c in range(128) if not ("a" <= chr(c) <= "z" or "0" <= chr(c) <= "9")}
 
+
+def sniff_encoding(head: bytes) -> str:
+    """Encoding named by a byte-order mark; DEFAULT_ENCODING (decoded with errors="replace") otherwise."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return DEFAULT_ENCODING
+
+
+def read_text_file(p: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Read once, decoding with the encoding sniffed from the BOM. Files of MMAP_MIN_BYTES or
+    more are decoded straight from a read-only mmap (no intermediate bytes copy), with
+    newlines translated as text mode does.
+    """
+    try:
+        with open(p, "rb") as raw:
+            if os.fstat(raw.fileno()).st_size < MMAP_MIN_BYTES:
+                enc = sniff_encoding(raw.peek(4)[:4])
+                with io.TextIOWrapper(raw, encoding=enc, errors="replace") as f:
+                    return f.read(), enc
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                enc = sniff_encoding(mm[:4])
+                text = str(mm, enc, "replace")
+    except Exception:
+        return None, None
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, enc
+
+
+@lru_cache(maxsize=1_000_000)
 def norm_key(s: str) -> str:
+    """Normalize so CSV title and filename stem compare equal (memoized: titles repeat across years)."""
     s = (s or "").strip().lower()
     s = unescape(s)
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"[\u2018\u2019\u201C\u201D]", "'", s)  # curly → straight quotes
-    s = re.sub(r"[^a-z0-9 ]+", " ", s)                 # keep alnum + spaces
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # keep alnum + spaces (curly quotes and all other punctuation become spaces), collapse runs
+    if s.isascii():
+        return " ".join(s.translate(ASCII_NON_ALNUM_TABLE).split())
+    return " ".join(NON_ALNUM_PATTERN.sub(" ", s).split())
 
 
-def html_to_text(html: str) -> str:
-    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
-    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
-    html = re.sub(r"(?s)<[^>]+>", " ", html)
-    txt = unescape(html)
-    txt = re.sub(r"\s+", " ", txt).strip()
-    return txt
+def count_words(text: str) -> int:
+    """Number of WORD_PATTERN matches, counted without building the list of words."""
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
 
 
 def word_count_from_html(html: str) -> int:
-    return len(re.findall(r"\b\w+\b", html_to_text(html)))
+    if etree is not None and html:
+        try:
+            try:
+                root = etree.fromstring(html, LXML_PARSER)
+            except ValueError:
+                # str content with an <?xml encoding=...?> declaration: lxml wants bytes
+                root = etree.fromstring(html.encode("utf-8", errors="replace"), LXML_PARSER)
+        except (etree.ParserError, ValueError):
+            root = None
+        if root is not None:
+            etree.strip_elements(root, "script", "style", with_tail=False)
+            # element text only (comments and processing instructions are not words), counted
+            # per text node as it is walked: no joined copy of the document text
+            return sum(map(count_words, root.itertext(etree.Element)))
+    # whitespace collapsing does not change the count: skip it
+    return count_words(unescape(MARKUP_PATTERN.sub(" ", html)))
+
+
+def approx_word_count(html: str) -> int:
+    """
+    Cheap word_count estimate for WORD_COUNT_MODE=approx: ~6 characters per word after
+    allowing ~20 characters of markup per tag. Grows with the text, but is not a word count.
+    """
+    return max(1, (len(html) - html.count("<") * 20) // 6)
+
+
+def utf8_size(s: str) -> int:
+    """
+    UTF-8 size of s for the MAX_HTML_BYTES check, without encoding s when its code point count
+    decides: exact for ASCII (an O(1) flag), a lower bound once over the cap (>= 1 byte per
+    code point), an upper bound when even 4 bytes per code point stays within it.
+    """
+    n = len(s)
+    if s.isascii() or n > MAX_HTML_BYTES:
+        return n
+    if n * 4 <= MAX_HTML_BYTES:
+        return n * 4
+    return len(s.encode("utf-8", errors="replace"))
+
+
+def load_html(p: str) -> Tuple[Optional[str], int, int]:
+    """
+    Worker: read one HTML file -> (html, size in bytes, word count).
+    html is None if the file is unreadable or larger than MAX_HTML_BYTES.
+    """
+    try:
+        html_bytes = os.stat(p).st_size
+    except OSError:
+        return None, 0, 0
+    if html_bytes > MAX_HTML_BYTES:
+        return None, html_bytes, 0  # too big on disk: not read at all
+    html, _ = read_text_file(p)
+    if not html:
+        return None, 0, 0
+    # decoded UTF-8 is at most 3 bytes per raw byte: only re-measure when that could pass the cap
+    if html_bytes * 3 > MAX_HTML_BYTES:
+        html_bytes = utf8_size(html)
+        if html_bytes > MAX_HTML_BYTES:
+            return None, html_bytes, 0
+    if WORD_COUNT_MODE == "approx":
+        return html, html_bytes, approx_word_count(html)
+    return html, html_bytes, word_count_from_html(html)
+
+
+def load_document(task: Tuple[Any, Dict[str, Any]]) -> Tuple[Optional[bytes], int]:
+    """
+    Worker: (path, document without content) -> (BSON of the full document, size in bytes).
+    BSON is None if the file is unreadable or too big. Encoding the multi-MB content here
+    keeps it off the main process, which hands it to the driver as a RawBSONDocument.
+    """
+    p, document = task
+    html, html_bytes, wc = load_html(p)
+    if not html:
+        return None, html_bytes
+    document.update(word_count=wc, content=html)
+    return bson.encode(document), html_bytes
+
+
+def map_bounded(ex, fn, items: list, window: int):
+    """ex.map over items `window` at a time, so only one window of results is held in memory."""
+    for i in range(0, len(items), window):
+        yield from ex.map(fn, items[i:i + window], chunksize=READ_CHUNKSIZE)
 
 
 def pick_csv_in(tribunal_dir: Path) -> Optional[Path]:
@@ -74,69 +232,141 @@ def pick_csv_in(tribunal_dir: Path) -> Optional[Path]:
     return (pri or cands)[0]
 
 
-def load_csv_rows(csv_path: Path) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    for enc in FALLBACK_ENCODINGS:
+def load_csv_rows_pandas(csv_path: Path, enc: str) -> List[CsvRow]:
+    """load_csv_rows on pandas' C parser: alias resolution and filtering run column-wise."""
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, usecols=lambda c: c in CSV_HEADERS,
+                     encoding=enc, encoding_errors="replace")
+    out = pd.DataFrame(index=df.index)
+    for field, aliases in CSV_COLUMNS.items():
+        col = pd.Series("", index=df.index, dtype=object)
+        for h in reversed(aliases):
+            if h in df.columns:
+                v = df[h].fillna("")
+                col = v.where(v != "", col)
+        out[field] = col.astype(str).str.strip()
+    out = out[(out["year"] != "") & (out["doc_id"] != "") & (out["title"] != "")]
+    return list(map(CsvRow._make, out.itertuples(index=False, name=None)))
+
+
+def load_csv_rows(csv_path: Path) -> List[CsvRow]:
+    with open(csv_path, "rb") as f:
+        enc = sniff_encoding(f.read(4))
+    if pd is not None:
         try:
-            with open(csv_path, newline="", encoding=enc, errors="replace") as f:
-                reader = csv.DictReader(f)
-                for r in reader:
-                    rows.append({
-                        "year":   (r.get("year")   or r.get("Year")   or "").strip(),
-                        "doc_id": (r.get("doc_id") or r.get("Doc_id") or r.get("id") or "").strip(),
-                        "title":  (r.get("title")  or r.get("Title")  or "").strip(),
-                    })
-            break
-        except UnicodeDecodeError:
-            continue
-    return [r for r in rows if r["year"] and r["doc_id"] and r["title"]]
-
-
-def _prefers_html(new: Path, cur: Path) -> bool:
-    return new.suffix.lower() == ".html" and cur.suffix.lower() == ".htm"
-
-
-def build_year_index(year_dir: Path) -> Dict[str, Dict[str, Path]]:
+            return load_csv_rows_pandas(csv_path, enc)
+        except Exception as e:
+            print(f"   ⚠️ pandas could not parse {csv_path.name} ({e}), using csv module")
+    rows: List[CsvRow] = []
+    with open(csv_path, newline="", encoding=enc, errors="replace") as f:
+        reader = csv.reader(f)
+        pos = {h: i for i, h in enumerate(next(reader, []))}  # repeated header: last column, as DictReader
+        cols = [[pos[h] for h in aliases if h in pos] for aliases in CSV_COLUMNS.values()]
+        if not all(cols):
+            return rows
+        if all(len(c) == 1 for c in cols):
+            # one header per field (the usual log file): plain positional picks
+            get = itemgetter(*(c[0] for c in cols))
+            width = max(c[0] for c in cols) + 1
+            for r in reader:
+                if len(r) >= width:
+                    year, doc_id, title = get(r)
+                    row = CsvRow(year.strip(), doc_id.strip(), title.strip())
+                    if row.year and row.doc_id and row.title:
+                        rows.append(row)
+            return rows
+        for r in reader:
+            n = len(r)
+            # first non-empty alias per field
+            row = CsvRow(*(next((r[i] for i in c if i < n and r[i]), "").strip() for c in cols))
+            if row.year and row.doc_id and row.title:
+                rows.append(row)
+    return rows
+
+
+def build_year_index(year_dir: Path) -> Dict[str, Dict[str, str]]:
     """
     Build two indexes for a year folder:
-    - by_id: filename stem is exactly digits (doc_id) -> Path
-    - by_title: normalized filename stem -> Path
+    - by_id: filename stem is exactly digits (doc_id) -> path
+    - by_title: normalized filename stem -> path
     Prefer .html over .htm when both exist.
+    Walks with os.scandir: entry types come from the directory read, no stat per file.
     """
-    by_id: Dict[str, Path] = {}
-    by_title: Dict[str, Path] = {}
+    by_id: Dict[str, str] = {}
+    by_title: Dict[str, str] = {}
+    is_html: Dict[str, bool] = {}  # path -> .html (vs .htm)
+    stack = [str(year_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    continue
+                name = e.name.lower()
+                if name.endswith(".html"):
+                    html = True
+                elif name.endswith(".htm"):
+                    html = False
+                else:
+                    continue
+                if not e.is_file():
+                    continue
+                is_html[e.path] = html
+                stem = e.name[:e.name.rfind(".")]
 
-    for p in year_dir.rglob("*"):
-        if not p.is_file() or p.suffix.lower() not in (".html", ".htm"):
-            continue
+                # exact doc_id filenames (digits only)
+                if DOC_ID_PATTERN.fullmatch(stem):
+                    if stem not in by_id or (html and not is_html[by_id[stem]]):
+                        by_id[stem] = e.path
 
-        stem = p.stem
+                # title mapping
+                tkey = norm_key(stem)
+                if tkey not in by_title or (html and not is_html[by_title[tkey]]):
+                    by_title[tkey] = e.path
 
-        # exact doc_id filenames (digits only)
-        if re.fullmatch(r"\d+", stem or ""):
-            if stem not in by_id or _prefers_html(p, by_id[stem]):
-                by_id[stem] = p
+    return {"by_id": by_id, "by_title": by_title}
 
-        # title mapping
-        tkey = norm_key(stem)
-        if tkey not in by_title or _prefers_html(p, by_title[tkey]):
-            by_title[tkey] = p
 
-    return {"by_id": by_id, "by_title": by_title}
+def build_year_indexes(year_dirs: List[Path]) -> Dict[Path, Dict[str, Dict[str, str]]]:
+    """Scan all year folders of a tribunal concurrently (scandir releases the GIL)."""
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
+        return dict(zip(year_dirs, ex.map(build_year_index, year_dirs)))
 
 
 def connect_collection():
-    client = MongoClient(MONGO_URI)
+    # bulk load: primary ack without journal wait, compressed wire (HTML compresses well)
+    client = MongoClient(MONGO_URI, w=1, journal=False, compressors="zstd,zlib")
     db = client[DB_NAME]
     col = db[COLL_NAME]
     client.admin.command("ping")
     return client, col
 
 
-def ensure_indexes(col):
+def ensure_indexes(col, secondary: bool = True):
+    # upserts look documents up by doc_id: always in place before writing
     col.create_index([("doc_id", ASCENDING)], unique=True, name="doc_id_unique")
+    if not secondary:
+        return
+    # metadata only: never index content (multi-MB HTML would not fit the index in RAM)
     col.create_index([("year", ASCENDING)], name="year_idx")
     col.create_index([("category_name", ASCENDING), ("year", ASCENDING)], name="tribunal_year_idx")
+    # Backs the web fallback list query: {category_name, year} sorted by full_title
+    col.create_index([("category_name", ASCENDING), ("year", ASCENDING), ("full_title", ASCENDING)],
+                     name="tribunal_year_title_idx")
+    # Backs the web fallback category listing (group by law_type, category_name)
+    col.create_index([("law_type", ASCENDING), ("category_name", ASCENDING)], name="law_type_category_idx")
+
+
+def flush_upserts(col, ops: List[UpdateOne]) -> Tuple[int, int, int]:
+    """Send a batch of upserts in one unordered bulk_write -> (upserted, matched, failed)."""
+    if not ops:
+        return 0, 0, 0
+    try:
+        res = col.bulk_write(ops, ordered=False, bypass_document_validation=True)
+        return res.upserted_count, res.matched_count, 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        print(f"   ⚠️ BulkWriteError: {len(errors)} failed, e.g. {errors[:3]} …")
+        return e.details.get("nUpserted", 0), e.details.get("nMatched", 0), len(errors)
 
 
 def parse_args():
@@ -167,8 +397,16 @@ def ingest():
         return
 
     client, col = connect_collection()
+    readers = ProcessPoolExecutor(max_workers=READ_WORKERS, mp_context=MP_CONTEXT)
     try:
-        ensure_indexes(col)
+        ensure_indexes(col, secondary=not BUILD_INDEXES_AFTER)
+
+        # existing ids, fetched once, only if we're insert-only (doc_ids re-used by a later
+        # tribunal in this run still hit $setOnInsert and are counted as skipped_existing)
+        existing_ids: Set[int] = set()
+        if not args.update_existing:
+            cur = col.find({}, {"_id": 0, "doc_id": 1}).batch_size(10_000)
+            existing_ids = {d["doc_id"] for d in cur}
 
         all_tribs = sorted([d for d in root.iterdir() if d.is_dir()])
         tribunals = [d for d in all_tribs if not trib_only or d.name in trib_only]
@@ -187,105 +425,106 @@ def ingest():
 
             # optional filter by year
             if year_only:
-                rows = [r for r in rows if r["year"] in year_only]
+                rows = [r for r in rows if r.year in year_only]
                 if not rows:
                     print(f"ℹ️  {category_name}: no rows for selected years, skipping.")
                     continue
 
-            # fetch existing ids only if we're insert-only
-            existing_ids: Set[int] = set()
-            if not args.update_existing:
-                ids = []
-                for r in rows:
-                    try:
-                        ids.append(int(r["doc_id"]))
-                    except Exception:
-                        pass
-                if ids:
-                    cur = col.find({"doc_id": {"$in": ids}}, {"doc_id": 1})
-                    existing_ids = {d["doc_id"] for d in cur}
-
             inserted = updated = skipped_existing = unmatched = 0
-
-            # group by year
-            by_year: Dict[str, List[Dict[str, str]]] = {}
+            ops: List[UpdateOne] = []
+            ops_bytes = 0  # BSON bytes of the documents in ops
+
+            def flush():
+                """Write the pending ops; matched docs were updated, or left alone if insert-only."""
+                nonlocal inserted, updated, skipped_existing, unmatched, ops_bytes
+                n_upserted, n_matched, n_failed = flush_upserts(col, ops)
+                inserted += n_upserted
+                if args.update_existing:
+                    updated += n_matched
+                else:
+                    skipped_existing += n_matched
+                unmatched += n_failed
+                ops.clear()
+                ops_bytes = 0
+
+            # group by year; insert-only rows already stored are settled here, so a year
+            # with nothing left to load is never scanned
+            by_year: Dict[str, List[CsvRow]] = {}
             for r in rows:
-                by_year.setdefault(r["year"], []).append(r)
+                if not args.update_existing and r.doc_id.isdecimal() and int(r.doc_id) in existing_ids:
+                    skipped_existing += 1
+                    continue
+                by_year.setdefault(r.year, []).append(r)
+
+            tasks: List[Tuple[str, Dict[str, Any]]] = []  # (path, document without content)
+            year_indexes = build_year_indexes([trib_dir / y for y in by_year if (trib_dir / y).is_dir()])
 
             for year_str, year_rows in sorted(by_year.items()):
                 year_dir = trib_dir / year_str
-                if not (year_dir.exists() and year_dir.is_dir()):
+                if year_dir not in year_indexes:
                     print(f"  ⚠️ {category_name}/{year_str}: folder missing (rows={len(year_rows)})")
                     unmatched += len(year_rows)
                     continue
 
-                idx = build_year_index(year_dir)
+                idx = year_indexes[year_dir]
                 by_id = idx["by_id"]
                 by_title = idx["by_title"]
 
                 for row in year_rows:
                     # parse ids
                     try:
-                        doc_id_int = int(row["doc_id"])
+                        doc_id_int = int(row.doc_id)
                         year_int = int(year_str)
                     except Exception:
                         unmatched += 1
                         continue
 
-                    # Skip existing in insert-only mode
-                    if not args.update_existing and doc_id_int in existing_ids:
-                        skipped_existing += 1
-                        continue
-
                     # EITHER doc_id OR title
                     p = by_id.get(str(doc_id_int))
                     if not p:
-                        p = by_title.get(norm_key(row["title"]))
+                        p = by_title.get(norm_key(row.title))
 
                     if not p:
                         unmatched += 1
                         continue
 
-                    html, enc = read_text_file(p)
-                    if not html:
-                        unmatched += 1
-                        continue
-
-                    html_bytes = len(html.encode("utf-8", errors="replace"))
-                    if html_bytes > MAX_HTML_BYTES:
-                        print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
-                        unmatched += 1
-                        continue
-
-                    document = {
+                    tasks.append((p, {
                         "doc_id": doc_id_int,
-                        "full_title": row["title"],
+                        "full_title": row.title,
                         "category": "tribunals",
                         "category_name": category_name,
                         "year": year_int,
                         "law_type": "tribunal",
-                        "word_count": word_count_from_html(html),
-                        "content": html
-                    }
-
-                    if args.update_existing:
-                        res = col.update_one({"doc_id": doc_id_int}, {"$set": document}, upsert=True)
-                        if res.matched_count == 0 and res.upserted_id is not None:
-                            inserted += 1
-                        else:
-                            updated += 1
-                    else:
-                        res = col.update_one({"doc_id": doc_id_int}, {"$setOnInsert": document}, upsert=True)
-                        if res.upserted_id is not None:
-                            inserted += 1
-                        else:
-                            skipped_existing += 1
+                    }))
+
+            # file reads, word counts and BSON encoding are CPU-bound: run them in worker processes
+            loaded = map_bounded(readers, load_document, tasks, READ_WORKERS * READ_CHUNKSIZE * 2)
+            for (p, document), (raw, html_bytes) in zip(tasks, loaded):
+                if raw is None:
+                    if html_bytes > MAX_HTML_BYTES:
+                        print(f"   🚫 too big, skipping: {p} ({html_bytes} bytes)")
+                    unmatched += 1
+                    continue
+
+                update = "$set" if args.update_existing else "$setOnInsert"
+                ops.append(UpdateOne({"doc_id": document["doc_id"]}, {update: RawBSONDocument(raw)}, upsert=True))
+                ops_bytes += len(raw)
+                # a batch of large judgments is held in memory until sent: bound it by size too
+                if len(ops) >= BULK_SIZE or ops_bytes >= BULK_BYTES:
+                    flush()
 
+            flush()
             print(f"✅ {category_name}: inserted={inserted}, updated={updated}, skipped_existing={skipped_existing}, unmatched={unmatched}")
 
         total = col.count_documents({})
         print({"total_docs_in_collection": total})
     finally:
+        if BUILD_INDEXES_AFTER:
+            try:
+                ensure_indexes(col)
+            except Exception as e:
+                print(f"❌ Error creating indexes: {e}")
+        readers.shutdown()
         client.close()
         print("✅ MongoDB connection closed.")
 
@@ -20,6 +20,7 @@ MONGO_DB         (default: legal_dashboard_db)
 DOC_LINKS_COLL   (default: document_links)
 ACTS_COLL        (default: acts)
 BATCH_SIZE       (default: 5000)
+BULK_UNACK       (default: 0)  # set to 1 for unacknowledged (w=0) link writes
 LINKS_DO_ACTS    (default: 1)  # set to 0 to noop
 # Debug filters:
 ONLY_ACT_DOC_ID  (no default)  # if set, process only this act doc_id (int)
@@ -28,8 +29,8 @@ LIMIT_ACTS       (no default)  # if set, limit number of acts scanned (int)
 
 import os
 import re
-from typing import Optional, Any, Set, List
-from pymongo import MongoClient, UpdateOne
+from typing import Optional, Any, Dict, Set, List
+from pymongo import MongoClient, UpdateOne, WriteConcern
 from pymongo.errors import BulkWriteError
 
 # ---------- CONFIG ----------
@@ -38,16 +39,17 @@ DB_NAME          = os.getenv("MONGO_DB", "legal_dashboard_db")
 DOC_LINKS_COLL   = os.getenv("DOC_LINKS_COLL", "document_links")
 ACTS_COLL        = os.getenv("ACTS_COLL", "acts")
 BATCH_SIZE       = int(os.getenv("BATCH_SIZE", "5000"))
+# w=0: no ack wait per batch; kind_doc_unique keeps re-runs safe, but write errors go unseen
+BULK_UNACK       = os.getenv("BULK_UNACK", "0").lower() in ("1","true","yes")
 DO_ACTS          = os.getenv("LINKS_DO_ACTS", "1").lower() in ("1","true","yes")
 ONLY_ACT_DOC_ID  = os.getenv("ONLY_ACT_DOC_ID")
 LIMIT_ACTS_ENV   = os.getenv("LIMIT_ACTS")
 LIMIT_ACTS       = int(LIMIT_ACTS_ENV) if (LIMIT_ACTS_ENV and LIMIT_ACTS_ENV.isdigit()) else None
 # ----------------------------
 
-# Regex tuned to your HTML: matches /doc/123/ or /doc/123
-DOC_HREF_RE   = re.compile(r'href="/doc/(\d+)/?"')
-# Also support data attributes if present anywhere
-DATA_ATTR_RE  = re.compile(r'data-doc-id=["\'](\d+)["\']')
+# Regex tuned to your HTML: matches /doc/123/ or /doc/123 (group 1),
+# also data attributes if present anywhere (group 2); one scan for both
+CHILD_ID_RE   = re.compile(r'href="/doc/(\d+)/?"|data-doc-id=["\'](\d+)["\']')
 
 # Candidate fields that might contain child IDs directly (arrays)
 ARRAY_FIELDS  = [
@@ -71,7 +73,8 @@ def to_int(x: Any) -> Optional[int]:
 
 
 def connect():
-    client = MongoClient(MONGO_URI)
+    # bulk link writes: primary ack without journal wait
+    client = MongoClient(MONGO_URI, w=1, journal=False)
     db = client[DB_NAME]
     db.command("ping")
     return client, db
@@ -91,6 +94,8 @@ def bulk_upsert(col, ops: List[UpdateOne]) -> int:
         return 0
     try:
         res = col.bulk_write(ops, ordered=False)
+        if not res.acknowledged:
+            return len(ops)  # BULK_UNACK: no counts come back
         return (res.upserted_count or 0) + (res.modified_count or 0) + (res.matched_count or 0)
     except BulkWriteError as e:
         errs = (e.details or {}).get("writeErrors", [])
@@ -98,6 +103,14 @@ def bulk_upsert(col, ops: List[UpdateOne]) -> int:
         return 0
 
 
+def flush_links(col, pending: Dict[int, int]) -> int:
+    """Upsert the pending child -> parent links, one op per child, and clear them."""
+    ops = [UpdateOne({"kind": "act", "doc_id": child}, {"$set": {"parent_doc_id": parent}}, upsert=True)
+           for child, parent in pending.items()]
+    pending.clear()
+    return bulk_upsert(col, ops)
+
+
 def extract_child_ids(act_doc: dict) -> Set[int]:
     """
     Find subsection IDs inside an Act doc by scanning:
@@ -125,17 +138,9 @@ def extract_child_ids(act_doc: dict) -> Set[int]:
             break
 
     if html_text:
-        # Matches /doc/123 or /doc/123/
-        for m in DOC_HREF_RE.findall(html_text):
-            vi = to_int(m)
-            if vi is not None:
-                child_ids.add(vi)
-
-        # Optional: data-doc-id="123"
-        for m in DATA_ATTR_RE.findall(html_text):
-            vi = to_int(m)
-            if vi is not None:
-                child_ids.add(vi)
+        # href="/doc/123" or data-doc-id="123"; the groups are digits only, int() can't fail
+        for href_id, attr_id in CHILD_ID_RE.findall(html_text):
+            child_ids.add(int(href_id or attr_id))
 
     return child_ids
 
@@ -144,6 +149,8 @@ def build_act_links(db) -> dict:
     """Map each detected subsection -> parent main act."""
     acts  = db[ACTS_COLL]
     links = db[DOC_LINKS_COLL]
+    if BULK_UNACK:
+        links = links.with_options(write_concern=WriteConcern(w=0))
 
     # Projection: only fields we actually scan
     proj_fields = {"_id": 0, "doc_id": 1}
@@ -158,7 +165,9 @@ def build_act_links(db) -> dict:
 
     total_acts = 0
     total_pairs = 0
-    batch: List[UpdateOne] = []
+    # child -> parent for the next batch: a child linked from several acts is written once,
+    # with the last parent seen (the one its repeated upserts used to leave in place)
+    pending: Dict[int, int] = {}
 
     print("📚 Acts: mapping subsections → parent Act …")
     cur = acts.find(query, proj_fields).batch_size(BATCH_SIZE)
@@ -182,16 +191,14 @@ def build_act_links(db) -> dict:
             continue
 
         for child in children:
-            filt = {"kind": "act", "doc_id": child}
-            setv = {"$set": {"parent_doc_id": parent}}
-            batch.append(UpdateOne(filt, setv, upsert=True))
-            if len(batch) >= BATCH_SIZE:
-                total_pairs += bulk_upsert(links, batch); batch = []
+            pending[child] = parent
+            if len(pending) >= BATCH_SIZE:
+                total_pairs += flush_links(links, pending)
 
         if LIMIT_ACTS and total_acts >= LIMIT_ACTS:
             break
 
-    total_pairs += bulk_upsert(links, batch)
+    total_pairs += flush_links(links, pending)
     print(f"✅ Acts: upserted {total_pairs} subsection→parent links from {total_acts} Act(s)")
     return {"acts_scanned": total_acts, "subsection_links_upserted": total_pairs}
 
@@ -9,7 +9,8 @@ For each document in:
 
 Notes
 -----
-- Uses upserts + unique index on (kind, doc_id) → safe to re-run.
+- Uses inserts/upserts + unique index on (kind, doc_id) → safe to re-run;
+  self links already in place are skipped, so a re-run writes ~nothing.
 - Does not modify `catalog/catalogue` or the source collections.
 - Casts doc_id to int; change `to_int` if your ids are strings.
 - Highlighting remains on the frontend JS (not stored here).
@@ -22,6 +23,7 @@ DOC_LINKS_COLL      default: document_links
 JUDGMENTS_COLL      default: judgments
 TRIBUNALS_COLL      default: tribunals
 BATCH_SIZE          default: 5000
+BULK_UNACK          default: 0   (set 1 for unacknowledged (w=0) link writes)
 LINKS_DO_JUDGMENTS  default: 1   (set 0 to skip)
 LINKS_DO_TRIBUNALS  default: 1   (set 0 to skip)
 LIMIT_DOCS          default: none (set to an int to process only N docs for a quick test)
@@ -29,7 +31,7 @@ LIMIT_DOCS          default: none (set to an int to process only N docs for a qu
 
 import os
 from typing import Optional, Any, List
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient, UpdateOne, WriteConcern
 from pymongo.errors import BulkWriteError
 
 # ---------- CONFIG ----------
@@ -41,6 +43,8 @@ JUDG_COLL        = os.getenv("JUDGMENTS_COLL", "judgments")
 TRIB_COLL        = os.getenv("TRIBUNALS_COLL", "tribunals")
 
 BATCH_SIZE       = int(os.getenv("BATCH_SIZE", "5000"))
+# w=0: no ack wait per batch; kind_doc_unique keeps re-runs safe, but write errors go unseen
+BULK_UNACK       = os.getenv("BULK_UNACK", "0").lower() in ("1","true","yes")
 DO_JUDGMENTS     = os.getenv("LINKS_DO_JUDGMENTS", "1").lower() in ("1","true","yes")
 DO_TRIBUNALS     = os.getenv("LINKS_DO_TRIBUNALS", "1").lower() in ("1","true","yes")
 
@@ -57,7 +61,8 @@ def to_int(x: Any) -> Optional[int]:
         return None
 
 def connect():
-    client = MongoClient(MONGO_URI)
+    # bulk link writes: primary ack without journal wait
+    client = MongoClient(MONGO_URI, w=1, journal=False)
     db = client[DB_NAME]
     db.command("ping")
     return client, db
@@ -72,40 +77,74 @@ def bulk_upsert(col, ops: List[UpdateOne]) -> int:
         return 0
     try:
         res = col.bulk_write(ops, ordered=False)
+        if not res.acknowledged:
+            return len(ops)  # BULK_UNACK: no counts come back
         return (res.upserted_count or 0) + (res.modified_count or 0) + (res.matched_count or 0)
     except BulkWriteError as e:
         errs = (e.details or {}).get("writeErrors", [])
         print("⚠️  BulkWriteError (first 3):", errs[:3])
         return 0
 
+def bulk_insert(col, docs: List[dict]) -> int:
+    """insert_many new link rows; rows that already exist by now (duplicate key) are upserted."""
+    if not docs:
+        return 0
+    try:
+        return len(col.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        details = e.details or {}
+        errs = details.get("writeErrors", [])
+    dups = [docs[err["index"]] for err in errs if err.get("code") == 11000]
+    others = [err for err in errs if err.get("code") != 11000]
+    if others:
+        print("⚠️  BulkWriteError (first 3):", others[:3])
+    return (details.get("nInserted") or 0) + bulk_upsert(col, [
+        UpdateOne({"kind": d["kind"], "doc_id": d["doc_id"]},
+                  {"$set": {"parent_doc_id": d["parent_doc_id"]}}, upsert=True)
+        for d in dups
+    ])
+
 def build_self_links(db, coll_name: str, kind: str) -> dict:
     src  = db[coll_name]
     dest = db[DOC_LINKS_COLL]
+    if BULK_UNACK:
+        dest = dest.with_options(write_concern=WriteConcern(w=0))
 
     total_docs = 0
     upserts = 0
-    batch: List[UpdateOne] = []
+    batch: List[UpdateOne] = []   # rows present with another parent_doc_id
+    inserts: List[dict] = []      # rows not present yet
 
     print(f"🧾 {kind}: creating self links from `{coll_name}` …")
+    # rows already stored: correct self links need no write, the rest only a $set
+    stored = dest.find({"kind": kind}, {"_id": 0, "doc_id": 1, "parent_doc_id": 1}).batch_size(BATCH_SIZE)
+    parents = {d.get("doc_id"): d.get("parent_doc_id") for d in stored}
+    existing = len(parents)
     cur = src.find({}, {"_id": 0, "doc_id": 1}).batch_size(BATCH_SIZE)
 
     for doc in cur:
         total_docs += 1
         did = to_int(doc.get("doc_id"))
-        if did is None:
+        if did is None or parents.get(did, None) == did:
             continue
-        batch.append(UpdateOne(
-            {"kind": kind, "doc_id": did},
-            {"$set": {"parent_doc_id": did}},
-            upsert=True
-        ))
+        if did in parents:
+            batch.append(UpdateOne(
+                {"kind": kind, "doc_id": did},
+                {"$set": {"parent_doc_id": did}},
+                upsert=True
+            ))
+        else:
+            inserts.append({"kind": kind, "doc_id": did, "parent_doc_id": did})
+        parents[did] = did  # repeated doc_ids are written once
         if len(batch) >= BATCH_SIZE:
             upserts += bulk_upsert(dest, batch); batch = []
+        if len(inserts) >= BATCH_SIZE:
+            upserts += bulk_insert(dest, inserts); inserts = []
         if LIMIT_DOCS and total_docs >= LIMIT_DOCS:
             break
 
-    upserts += bulk_upsert(dest, batch)
-    print(f"✅ {kind}: {upserts} upserts (from {total_docs} docs)")
+    upserts += bulk_upsert(dest, batch) + bulk_insert(dest, inserts)
+    print(f"✅ {kind}: {upserts} upserts (from {total_docs} docs, {existing} links already stored)")
     return {"docs_scanned": total_docs, "self_links_upserted": upserts}
 
 def main():